@@ -0,0 +1,82 @@
+# analytics.py
+from datetime import datetime, timezone
+from config import EVENTS_FLUSH_INTERVAL, EVENTS_FLUSH_SIZE, EVENTS_MAX_BUFFER
+from database import db
+from stats import BatchWriter
+
+OPTION_INDEX = {"A": 0, "B": 1, "C": 2, "D": 3}
+
+
+# Журнал ответов: события копятся в памяти и записываются пачкой через COPY,
+# вместе с приращениями счётчиков по вопросам. Обработчик ответа в базу не ходит.
+# Если база недоступна и буфер переполнен, новые события отбрасываются (счётчик dropped).
+class AnswerLog(BatchWriter):
+    name = "журнала ответов"
+
+    def __init__(self, database, interval=EVENTS_FLUSH_INTERVAL, max_pending=EVENTS_FLUSH_SIZE,
+                 max_buffer=EVENTS_MAX_BUFFER):
+        super().__init__(interval)
+        self.db = database
+        self.max_pending = max_pending
+        self.max_buffer = max_buffer
+        self.events = []
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def add(self, telegram_id, question_id, topic, chosen, is_correct):
+        if len(self.events) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self.events.append((datetime.now(timezone.utc), telegram_id, question_id, topic, chosen, is_correct))
+        self.queued += 1
+        if len(self.events) >= self.max_pending:
+            self.wakeup()
+
+    async def flush(self):
+        async with self._lock:
+            if not self.events:
+                return
+            batch = self.events
+            self.events = []
+
+            # Счётчики по вопросам: попыток, верных, выборов A-D
+            counters = {}
+            for _, _, question_id, _, chosen, is_correct in batch:
+                row = counters.get(question_id)
+                if row is None:
+                    row = counters[question_id] = [0, 0, 0, 0, 0, 0]
+                row[0] += 1
+                row[1] += is_correct
+                row[2 + OPTION_INDEX[chosen]] += 1
+
+            try:
+                await self.db.add_answer_events(
+                    batch, [(question_id, *row) for question_id, row in counters.items()]
+                )
+            except Exception:
+                # Возвращаем пачку в начало буфера, лишнее сверх предела отбрасываем
+                self.events = (batch + self.events)[:self.max_buffer]
+                raise
+            self.flushed += len(batch)
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "pending": len(self.events),
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+# Самый частый неверный вариант по строке отчёта get_question_report
+def most_chosen_wrong(row):
+    counts = {"A": row['chosen_a'], "B": row['chosen_b'], "C": row['chosen_c'], "D": row['chosen_d']}
+    counts.pop(row['correct_option'], None)
+    option, count = max(counts.items(), key=lambda item: item[1])
+    return (option, count) if count else (None, 0)
+
+
+# Глобальный журнал ответов
+answer_log = AnswerLog(db)
@@ -0,0 +1,255 @@
+# bench/load_test.py
+# Нагрузочный тест: синтетические пользователи проходят тесты, админы добавляют вопросы.
+# Обновления подаются прямо в Dispatcher.feed_update, запросы к Telegram перехватывает
+# FakeSession, база — локальный PostgreSQL из настроек .env (DB_*).
+#
+#   python -m bench.load_test --users 1000 --admins 5 --concurrency 200
+import argparse
+import asyncio
+import itertools
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Union, get_origin
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+from database import db
+from analytics import answer_log
+from handlers import admin, user
+from keyboards import Answer
+from metrics import DB_ACQUIRE_WAIT, HandlerMetricsMiddleware
+from stats import stats_buffer
+from storage import PostgresStorage
+
+BENCH_TOPIC_PREFIX = "bench:"
+BOT_ID = 1
+TOKEN = f"{BOT_ID}:BENCHMARKBENCHMARKBENCHMARKBENCHMARK"
+USER_ID_BASE = 10_000_000
+ADMIN_ID_BASE = 20_000_000
+# Предел ответов на один тест, чтобы сбой не зациклил пользователя
+MAX_ANSWERS = 1000
+
+
+# Сессия бота без сети: запоминает вызовы API и отвечает правдоподобными объектами
+class FakeSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self.calls_by_chat = Counter()
+        self.last_text = {}
+        self.last_message_id = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            self.calls_by_chat[chat_id] += 1
+            text = getattr(method, "text", None) or getattr(method, "caption", None)
+            if text is not None:
+                self.last_text[chat_id] = text
+
+        returning = method.__returning__
+        if returning is bool or get_origin(returning) is Union:
+            return True
+        name = getattr(returning, "__name__", "")
+        if name == "Message":
+            message_id = self.last_message_id[chat_id] = next(self._message_ids)
+            return returning.model_validate({
+                "message_id": message_id,
+                "date": datetime.now(),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": getattr(method, "text", None),
+            }, context={"bot": bot})
+        if name == "User":
+            return returning.model_validate({"id": BOT_ID, "is_bot": True, "first_name": "bench"})
+        return None
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class Bench:
+    def __init__(self, bot, dp, session):
+        self.bot = bot
+        self.dp = dp
+        self.session = session
+        self.update_ids = itertools.count(1)
+        self.latencies = []
+        self.errors = 0
+        self.completed_tests = 0
+        self.quiz_calls = 0
+        self.added_questions = 0
+
+    async def feed(self, payload):
+        payload["update_id"] = next(self.update_ids)
+        update = Update.model_validate(payload, context={"bot": self.bot})
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ {e!r}")
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    async def message(self, user_id, text):
+        await self.feed({"message": {
+            "message_id": next(self.update_ids),
+            "date": datetime.now(),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": text,
+        }})
+
+    async def callback(self, user_id, data):
+        await self.feed({"callback_query": {
+            "id": str(next(self.update_ids)),
+            "chat_instance": str(user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "message": {
+                # Нажатие в последнем отправленном сообщении — как у настоящего пользователя
+                "message_id": self.session.last_message_id.get(user_id, 1),
+                "date": datetime.now(),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "bench"},
+                "text": "question",
+            },
+            "data": data,
+        }})
+
+    # Полный тест: выбор темы и ответы, пока бот не пришлёт итог
+    async def run_quiz(self, user_id, topic):
+        calls_before = self.session.calls_by_chat[user_id]
+        await self.message(user_id, "🧠 Пройти тест")
+        await self.message(user_id, topic)
+        for index in range(MAX_ANSWERS):
+            if self.session.last_text.get(user_id, "").startswith("✅ Тест завершен"):
+                self.completed_tests += 1
+                break
+            await self.callback(user_id, Answer(i=index, o="ABCD"[index % 4]).pack())
+        self.quiz_calls += self.session.calls_by_chat[user_id] - calls_before
+
+    async def run_admin(self, admin_id, topic, count):
+        for n in range(count):
+            for text in ("📥 Добавить вопрос", topic, f"Bench question {admin_id}-{n}?", "1", "2", "3", "4", "A", "/skip"):
+                await self.message(admin_id, text)
+            # Считаем только вопросы, которые бот подтвердил
+            if self.session.last_text.get(admin_id, "").startswith("✅ Вопрос успешно добавлен"):
+                self.added_questions += 1
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def seed(topics, questions):
+    records = [
+        (f"{BENCH_TOPIC_PREFIX}{t}", f"Bench {t}/{q}: сколько будет {q} + {t}?", "1", "2", "3", "4", "ABCD"[q % 4], None)
+        for t in range(topics) for q in range(questions)
+    ]
+    await db.import_questions(records)
+
+
+async def cleanup():
+    async with db.pool.acquire() as conn:
+        await conn.execute("""
+            DELETE FROM question_stats
+            WHERE question_id IN (SELECT id FROM questions WHERE topic LIKE $1)
+        """, BENCH_TOPIC_PREFIX + "%")
+        await conn.execute("DELETE FROM questions WHERE topic LIKE $1", BENCH_TOPIC_PREFIX + "%")
+        for table in ("user_stats", "answer_events"):
+            await conn.execute(
+                f"DELETE FROM {table} WHERE telegram_id >= $1 AND telegram_id < $2",
+                USER_ID_BASE, ADMIN_ID_BASE + 1_000_000,
+            )
+        await conn.execute(
+            "DELETE FROM user_topic_stats WHERE topic LIKE $1", BENCH_TOPIC_PREFIX + "%"
+        )
+        await conn.execute("DELETE FROM fsm_storage WHERE key LIKE $1", f"fsm:{BOT_ID}:%")
+    db.question_cache.invalidate()
+
+
+async def main(args):
+    await db.connect()
+    await db.migrate()
+    await seed(args.topics, args.questions)
+
+    session = FakeSession()
+    bot = Bot(TOKEN, session=session)
+    storage = PostgresStorage(db) if args.storage == "postgres" else MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    dp.include_router(admin.admin_router)
+    dp.include_router(user.user_router)
+
+    admin_ids = [ADMIN_ID_BASE + n for n in range(args.admins)]
+    db.admin_ids.update(admin_ids)
+    stats_buffer.start()
+    answer_log.start()
+
+    bench = Bench(bot, dp, session)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(coro):
+        async with semaphore:
+            await coro
+
+    jobs = [
+        limited(bench.run_quiz(USER_ID_BASE + n, f"{BENCH_TOPIC_PREFIX}{n % args.topics}"))
+        for n in range(args.users)
+    ]
+    jobs += [
+        limited(bench.run_admin(admin_id, f"{BENCH_TOPIC_PREFIX}{n % args.topics}", args.admin_questions))
+        for n, admin_id in enumerate(admin_ids)
+    ]
+
+    acquires_before = DB_ACQUIRE_WAIT.values.get((), [0])[-1]
+    started = time.perf_counter()
+    await asyncio.gather(*jobs)
+    # Сброс буферов входит в замер: это тоже нагрузка на базу
+    await stats_buffer.stop()
+    await answer_log.stop()
+    elapsed = time.perf_counter() - started
+    acquires = DB_ACQUIRE_WAIT.values.get((), [0])[-1] - acquires_before
+
+    updates = len(bench.latencies)
+    print(f"Обновлений: {updates} за {elapsed:.2f} с ({updates / elapsed:.0f} в секунду), ошибок: {bench.errors}")
+    print(
+        f"Задержка обработки, мс: p50 {percentile(bench.latencies, 50) * 1000:.1f}, "
+        f"p95 {percentile(bench.latencies, 95) * 1000:.1f}, p99 {percentile(bench.latencies, 99) * 1000:.1f}"
+    )
+    print(f"Запросов к базе (соединений из пула) на обновление: {acquires / max(updates, 1):.2f}")
+    print(
+        f"Тестов завершено: {bench.completed_tests} из {args.users}, "
+        f"вызовов API на тест: {bench.quiz_calls / max(bench.completed_tests, 1):.1f}"
+    )
+    print(f"Вопросов добавлено админами: {bench.added_questions}")
+    print("Вызовы API:", dict(session.calls.most_common()))
+
+    if not args.keep:
+        await cleanup()
+    await storage.close()
+    await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков бота")
+    parser.add_argument("--users", type=int, default=500, help="пользователей, проходящих тест")
+    parser.add_argument("--admins", type=int, default=5, help="админов, добавляющих вопросы")
+    parser.add_argument("--admin-questions", type=int, default=10, help="вопросов на одного админа")
+    parser.add_argument("--topics", type=int, default=10, help="тем в тестовом банке")
+    parser.add_argument("--questions", type=int, default=200, help="вопросов в каждой теме")
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременно активных пользователей")
+    parser.add_argument("--storage", choices=("memory", "postgres"), default="memory", help="хранилище FSM")
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовые данные после прогона")
+    asyncio.run(main(parser.parse_args()))
@@ -1,21 +1,78 @@
 # bot.py
 import asyncio
+from functools import partial
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
+from aiogram.fsm.storage.memory import MemoryStorage
+from config import BOT_TOKEN, BOT_MODE, FSM_STORAGE, METRICS_HOST, METRICS_PORT
 from database import db  # Используем глобальный объект базы данных
+from analytics import answer_log
+from charts import charts
+from leaderboard import leaderboard
+from media import media_uploader
+from metrics import UpdateMetricsMiddleware, HandlerMetricsMiddleware, register_gauges, start_metrics_server
+from sender import outbound
+from stats import stats_buffer
+from storage import PostgresStorage
+from throttling import throttle
+from timers import quiz_timer
+from webhook import run_webhook
 from handlers import admin
 from handlers import user
 
 bot = Bot(BOT_TOKEN)
-dp = Dispatcher()
+# Все исходящие запросы идут через планировщик с ограничением скорости
+bot.session.middleware(outbound)
+# Сессии FSM храним в PostgreSQL, чтобы их видели все процессы бота
+storage = PostgresStorage(db) if FSM_STORAGE == "postgres" else MemoryStorage()
+dp = Dispatcher(storage=storage)
+# Метрики: время обработки обновлений и отдельных хендлеров
+dp.update.outer_middleware(UpdateMetricsMiddleware())
+# Обновления одного пользователя — по очереди, с ограничением частоты и без повторных нажатий
+dp.message.outer_middleware(throttle)
+dp.callback_query.outer_middleware(throttle)
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
     
 async def main():
     await db.connect()  # Подключение к базе данных
-    await db.create_tables()  # Создание таблиц, если они не существуют
+    await db.migrate()  # Создание и обновление схемы базы данных
+    await db.load_admins()  # Список администраторов держим в памяти
+    stats_buffer.start()  # Фоновая пакетная запись статистики
+    answer_log.start()  # Фоновая запись журнала ответов
+    await leaderboard.start()  # Топ пользователей в памяти
+    if isinstance(storage, PostgresStorage):
+        storage.start_cleanup()  # Удаление брошенных сессий
+    quiz_timer.start(partial(user.on_quiz_timeout, bot, storage))  # Сроки тестов на время
+    charts.start()  # Процессы для отрисовки графиков
+
+    register_gauges("db_pool", lambda: {"size": db.pool.get_size(), "idle": db.pool.get_idle_size()})
+    register_gauges("question_cache", db.question_cache.stats)
+    register_gauges("stats_buffer", stats_buffer.stats)
+    register_gauges("answer_log", answer_log.stats)
+    register_gauges("outbound", outbound.stats)
+    register_gauges("quiz_timer", quiz_timer.stats)
+    register_gauges("charts", charts.stats)
+    register_gauges("throttle", throttle.stats)
+    register_gauges("media_uploader", media_uploader.stats)
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
 
     dp.include_router(admin.admin_router)
     dp.include_router(user.user_router)
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await stats_buffer.stop()  # Досохраняем накопленную статистику
+        await answer_log.stop()
+        leaderboard.stop()
+        quiz_timer.stop()
+        charts.stop()
+        await storage.close()
+        await db.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,132 @@
+# charts.py
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import CHART_WORKERS, CHART_MAX_PENDING, CHART_CACHE_SIZE
+
+# За сколько дней строить график и сколько тем на нём показывать
+CHART_DAYS = 90
+CHART_TOPICS = 5
+
+
+# Отрисовка графика в отдельном процессе: series — {тема: [(дата, % верных), ...]}.
+# matplotlib импортируется здесь, чтобы не загружать его в основной процесс бота.
+def render_progress_chart(series):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 4.5), dpi=100)
+    try:
+        for topic, points in series.items():
+            ax.plot([day for day, _ in points], [percent for _, percent in points], marker="o", label=topic)
+        ax.set_ylim(0, 100)
+        ax.set_ylabel("% верных ответов")
+        ax.set_title("Прогресс по темам")
+        ax.grid(alpha=0.3)
+        ax.legend(loc="lower left", fontsize="small")
+        fig.autofmt_xdate()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight")
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+
+# Строки get_user_progress -> данные для графика (самые активные темы)
+def progress_series(rows, max_topics=CHART_TOPICS):
+    series = {}
+    totals = {}
+    for row in rows:
+        series.setdefault(row['topic'], []).append((row['day'], round(100 * row['correct'] / row['answers'])))
+        totals[row['topic']] = totals.get(row['topic'], 0) + row['answers']
+    top = sorted(totals, key=totals.get, reverse=True)[:max_topics]
+    return {topic: series[topic] for topic in top}
+
+
+# Ключ кэша графика: меняется, как только в журнал ответов попадают новые ответы пользователя
+def series_key(series):
+    return hash(tuple((topic, tuple(points)) for topic, points in series.items()))
+
+
+# Графики рисуются в пуле процессов, чтобы не блокировать цикл событий.
+# Очередь ограничена: при перегрузке render() возвращает None, а не копит задачи.
+# Кэш по пользователю хранит ключ данных графика (series_key) и PNG, а после первой отправки —
+# file_id Telegram, по которому график отправляется повторно без загрузки.
+class ChartService:
+    def __init__(self, workers=CHART_WORKERS, max_pending=CHART_MAX_PENDING, cache_size=CHART_CACHE_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.pending = 0
+        self.cache = OrderedDict()  # telegram_id -> (ключ данных, png, file_id)
+        self.executor = None
+        self.rendered = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def start(self):
+        if self.executor is None:
+            # spawn, а не fork: родительский процесс уже с циклом событий и потоками to_thread,
+            # а fork копирует их состояние (в том числе захваченные блокировки)
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    # (png, file_id) для графика по этим же данным или None
+    def get(self, telegram_id, key):
+        entry = self.cache.get(telegram_id)
+        if entry is None or entry[0] != key:
+            return None
+        self.cache.move_to_end(telegram_id)
+        return entry[1], entry[2]
+
+    def remember(self, telegram_id, key, png=None, file_id=None):
+        self.cache[telegram_id] = (key, None if file_id else png, file_id)
+        self.cache.move_to_end(telegram_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def render(self, series):
+        if self.executor is None or self.pending >= self.max_pending:
+            self.rejected += 1
+            return None
+        self.pending += 1
+        executor = self.executor
+        try:
+            loop = asyncio.get_running_loop()
+            png = await loop.run_in_executor(executor, render_progress_chart, series)
+        except Exception as e:
+            # Без графика пользователь получит статистику текстом
+            self.errors += 1
+            print(f"❌ Ошибка отрисовки графика: {e!r}")
+            if isinstance(e, BrokenProcessPool) and self.executor is executor:
+                # Процесс пула упал — пул больше не принимает задачи, создаём новый
+                self.stop()
+                self.start()
+            return None
+        finally:
+            self.pending -= 1
+        self.rendered += 1
+        return png
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "cached": len(self.cache),
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+
+# Глобальный сервис графиков
+charts = ChartService()
@@ -10,4 +10,93 @@ DB_CONFIG = {
     "database": os.getenv("DB_NAME"),
     "host": os.getenv("DB_HOST"),
     "port": 5432
-}
\ No newline at end of file
+}
+
+# Сколько тем держать в кэше вопросов (давно не использованные вытесняются)
+QUESTION_CACHE_TOPICS = int(os.getenv("QUESTION_CACHE_TOPICS", 256))
+# Сколько вопросов держать в общем индексе по id
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", 50000))
+
+# Пакетная запись статистики: интервал сброса (сек) и число пользователей в буфере
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", 5))
+STATS_FLUSH_SIZE = int(os.getenv("STATS_FLUSH_SIZE", 500))
+
+# Сколько вопросов показывать админу на одной странице
+QUESTIONS_PAGE_SIZE = int(os.getenv("QUESTIONS_PAGE_SIZE", 10))
+
+# Режим работы: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес, на который Telegram шлёт обновления (без пути). Пустой — вебхук
+# у Telegram не регистрируется, сервер можно проверять локальными POST-запросами.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет, который Telegram присылает в каждом запросе вебхука; в режиме вебхука обязателен
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", 8080))
+# Сколько обновлений обрабатывается одновременно и сколько ждать их завершения при остановке
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 100))
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", 30))
+
+# Хранилище FSM: "postgres" (общее для всех процессов) или "memory"
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+# Через сколько секунд бездействия сессия считается брошенной и удаляется
+FSM_TTL = int(os.getenv("FSM_TTL", 24 * 60 * 60))
+# Локальный кэш состояний: размер и время жизни записи (сек); 0 — без кэша (по умолчанию).
+# Между процессами кэш не сбрасывается, поэтому включать его можно только при одном процессе
+# или при «липкой» маршрутизации, когда обновления одного пользователя всегда идут в один процесс
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 0))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", 2))
+
+# Ограничения исходящих запросов к Telegram: всего в секунду и на один чат
+SEND_RATE = float(os.getenv("SEND_RATE", 30))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", 5))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+# Сколько сообщений рассылки отправляется одновременно
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 20))
+
+# Тест в одном сообщении: вопрос редактируется на месте вместо удаления и новой отправки
+QUIZ_EDIT_MESSAGE = os.getenv("QUIZ_EDIT_MESSAGE", "1") == "1"
+# Сколько вопросов случайно выбирать в тест (0 — все вопросы темы) и перемешивать ли варианты
+QUIZ_LENGTH = int(os.getenv("QUIZ_LENGTH", 20))
+QUIZ_SHUFFLE_OPTIONS = os.getenv("QUIZ_SHUFFLE_OPTIONS", "1") == "1"
+
+# Рейтинг: сколько мест держать в памяти, как часто перечитывать из базы (сек)
+# и для скольких тем держать рейтинги
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", 100))
+LEADERBOARD_REFRESH = float(os.getenv("LEADERBOARD_REFRESH", 60))
+LEADERBOARD_TOPICS = int(os.getenv("LEADERBOARD_TOPICS", 64))
+
+# Журнал ответов: интервал записи (сек), размер пачки и предел буфера в памяти
+EVENTS_FLUSH_INTERVAL = float(os.getenv("EVENTS_FLUSH_INTERVAL", 5))
+EVENTS_FLUSH_SIZE = int(os.getenv("EVENTS_FLUSH_SIZE", 5000))
+EVENTS_MAX_BUFFER = int(os.getenv("EVENTS_MAX_BUFFER", 200000))
+
+# Метрики Prometheus: адрес HTTP-сервера (порт 0 — выключен) и порог медленных запросов (мс, 0 — не писать)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+
+# Тест на время: секунд на вопрос и на весь тест (0 — без ограничения)
+QUIZ_QUESTION_TIME = int(os.getenv("QUIZ_QUESTION_TIME", 0))
+QUIZ_TEST_TIME = int(os.getenv("QUIZ_TEST_TIME", 0))
+
+# Графики прогресса: процессов отрисовки, максимум графиков в очереди и в кэше
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", 2))
+CHART_MAX_PENDING = int(os.getenv("CHART_MAX_PENDING", 8))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", 10000))
+
+# Выгрузка /export: строк за одно чтение курсора
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# Ограничение входящих обновлений на пользователя: в секунду, пачка подряд,
+# окно, в котором повторное нажатие той же кнопки отбрасывается, и сколько пользователей помнить
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", 3))
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", 6))
+THROTTLE_DEDUP_WINDOW = float(os.getenv("THROTTLE_DEDUP_WINDOW", 1.0))
+THROTTLE_CACHE_SIZE = int(os.getenv("THROTTLE_CACHE_SIZE", 10000))
+
+# Картинки к вопросам: каталог локальных файлов и сколько файлов загружать в Telegram одновременно
+MEDIA_DIR = os.getenv("MEDIA_DIR", "media")
+MEDIA_UPLOAD_CONCURRENCY = int(os.getenv("MEDIA_UPLOAD_CONCURRENCY", 4))
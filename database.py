@@ -1,106 +1,571 @@
 # database.py
+import asyncio
+import inspect
+import os
+from collections import OrderedDict, namedtuple
 import asyncpg
-from config import DB_CONFIG
+from config import DB_CONFIG, QUESTION_CACHE_TOPICS, QUESTION_CACHE_SIZE
+from metrics import TimedPool, observe_query
+
+# Канал NOTIFY, через который процессы бота сообщают об изменении банка вопросов
+QUESTIONS_CHANNEL = "questions_changed"
+# Канал NOTIFY для изменений списка администраторов ("+id" / "-id")
+ADMINS_CHANNEL = "admins_changed"
+
+# Пауза между попытками переподключить соединение LISTEN, секунд
+LISTENER_RETRY_DELAY = 5
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATIONS_LOCK_ID = 7_400_001
+# Пауза между попытками взять блокировку миграций, секунд
+MIGRATIONS_LOCK_RETRY = 0.5
+NO_TRANSACTION_MARK = "-- no-transaction"
+
+# Поля вопроса, которые админ может менять
+QUESTION_FIELDS = ("topic", "question", "option_a", "option_b", "option_c", "option_d", "correct_option")
+
+# media_file_id / media_path — необязательная картинка к вопросу
+Question = namedtuple("Question", [
+    "id", "topic", "question", "option_a", "option_b", "option_c", "option_d", "correct_option",
+    "media_file_id", "media_path"
+], defaults=(None, None))
+
+# Запросы для /export: колонки выгрузки совпадают с колонками запроса
+EXPORT_QUERIES = {
+    "questions": "SELECT " + ", ".join(Question._fields) + " FROM questions ORDER BY id",
+    "stats": """
+        SELECT telegram_id, total_tests, correct_answers
+        FROM user_stats
+        ORDER BY correct_answers DESC, telegram_id
+    """,
+}
+
+
+# Файлы миграций вида 0001_name.sql, отсортированные по номеру
+def load_migrations():
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        if not filename.endswith(".sql"):
+            continue
+        version = int(filename.split("_", 1)[0])
+        migrations.append((version, filename[:-4], os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+# Разбиение файла на отдельные команды (без пустых и чисто комментарных кусков)
+def split_sql(sql):
+    statements = []
+    for chunk in sql.split(";\n"):
+        lines = [line for line in chunk.strip().splitlines() if not line.strip().startswith("--")]
+        statement = "\n".join(lines).strip().rstrip(";")
+        if statement:
+            statements.append(statement)
+    return statements
+
+
+# Кэш банка вопросов: список тем, неизменяемые кортежи id вопросов по темам
+# (из них выбираются вопросы для теста) и общий индекс вопросов по id
+# (из него сессии теста берут тексты вопросов).
+# Версия увеличивается при каждой инвалидации, чтобы результат запроса,
+# начатого до изменения, не попал в кэш после него.
+class QuestionCache:
+    def __init__(self, max_topics=QUESTION_CACHE_TOPICS, max_questions=QUESTION_CACHE_SIZE):
+        self.max_topics = max_topics
+        self.max_questions = max_questions
+        self.version = 0
+        self.topics = None
+        self.by_topic = OrderedDict()
+        self.by_id = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self.version += 1
+        self.topics = None
+        self.by_topic.clear()
+        self.by_id.clear()
+
+    def get_topics(self):
+        if self.topics is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return self.topics
+
+    def set_topics(self, topics, version):
+        if version == self.version:
+            self.topics = tuple(topics)
+
+    def get_topic_ids(self, topic):
+        ids = self.by_topic.get(topic)
+        if ids is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.by_topic.move_to_end(topic)
+        return ids
+
+    def set_topic_ids(self, topic, ids, version):
+        if version != self.version:
+            return
+        self.by_topic[topic] = tuple(ids)
+        self.by_topic.move_to_end(topic)
+        # Вытесняем давно не использованные темы
+        while len(self.by_topic) > self.max_topics:
+            self.by_topic.popitem(last=False)
+
+    def get_question(self, question_id):
+        question = self.by_id.get(question_id)
+        if question is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.by_id.move_to_end(question_id)
+        return question
+
+    def put_questions(self, questions, version):
+        if version != self.version:
+            return
+        for question in questions:
+            self.by_id[question.id] = question
+            self.by_id.move_to_end(question.id)
+        while len(self.by_id) > self.max_questions:
+            self.by_id.popitem(last=False)
+
+    # Замена уже закэшированного вопроса (например, после сохранения file_id картинки)
+    def replace_question(self, question):
+        if question.id in self.by_id:
+            self.by_id[question.id] = question
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "topics_cached": len(self.by_topic),
+            "questions_cached": len(self.by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
 
 class Database:
     def __init__(self):
         self.pool = None
+        self.listener = None
+        self._listener_task = None
+        self.question_cache = QuestionCache()
+        # ID администраторов; загружается при старте и обновляется через NOTIFY
+        self.admin_ids = set()
+        # Вызываются после фиксации пакета статистики: listener(итоги, итоги по темам)
+        self.stats_listeners = []
+        # Уже созданные секции журнала ответов (год, месяц)
+        self.answer_partitions = set()
 
     async def connect(self):
         try:
-            self.pool = await asyncpg.create_pool(**DB_CONFIG)
+            # Пул оборачиваем для замера ожидания свободного соединения
+            self.pool = TimedPool(await asyncpg.create_pool(**DB_CONFIG))
             print("✅ База данных подключена!")
         except Exception as e:
             print(f"❌ Ошибка подключения к базе данных: {e}")
             raise
 
-    async def create_tables(self):
+        await self._listen()
+
+    # Отдельное соединение для LISTEN: соединения пула сбрасываются при возврате
+    async def _listen(self):
+        listener = await asyncpg.connect(**DB_CONFIG)
+        await listener.add_listener(QUESTIONS_CHANNEL, self._on_questions_changed)
+        await listener.add_listener(ADMINS_CHANNEL, self._on_admins_changed)
+        listener.add_termination_listener(self._on_listener_lost)
+        self.listener = listener
+
+    # Соединение LISTEN потеряно (перезапуск базы, обрыв): пока его нет, уведомления
+    # других процессов не приходят, поэтому переподключаемся в фоне
+    def _on_listener_lost(self, connection):
+        if connection is not self.listener:
+            return
+        self.listener = None
+        print("❌ Соединение LISTEN с базой потеряно, переподключаюсь...")
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self):
+        while True:
+            try:
+                await self._listen()
+                # Уведомления, отправленные без нас, потеряны — перечитываем состояние
+                self.question_cache.invalidate()
+                await self.load_admins()
+                break
+            except Exception as e:
+                if self.listener is not None:
+                    self.listener.remove_termination_listener(self._on_listener_lost)
+                    self.listener.terminate()
+                    self.listener = None
+                print(f"❌ Не удалось переподключить LISTEN: {e}")
+                await asyncio.sleep(LISTENER_RETRY_DELAY)
+        print("✅ Соединение LISTEN восстановлено")
+
+    async def close(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            self._listener_task = None
+        if self.listener is not None:
+            # Закрытие по нашей инициативе — переподключаться не нужно
+            self.listener.remove_termination_listener(self._on_listener_lost)
+            await self.listener.close()
+            self.listener = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def _on_questions_changed(self, connection, pid, channel, payload):
+        self.question_cache.invalidate()
+
+    def _on_admins_changed(self, connection, pid, channel, payload):
+        if not payload:
+            return
+        telegram_id = int(payload[1:])
+        if payload[0] == "+":
+            self.admin_ids.add(telegram_id)
+        else:
+            self.admin_ids.discard(telegram_id)
+
+    # Загрузка списка администраторов в память (вызывается при старте)
+    async def load_admins(self):
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS admins (
-                    id SERIAL PRIMARY KEY,
-                    telegram_id BIGINT UNIQUE,
-                    username TEXT
-                );
-
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    id SERIAL PRIMARY KEY,
-                    telegram_id BIGINT,
-                    total_tests INT DEFAULT 0,
-                    correct_answers INT DEFAULT 0
-                );
-
-
-                CREATE TABLE IF NOT EXISTS questions (
-                    id SERIAL PRIMARY KEY,
-                    topic TEXT,
-                    question TEXT,
-                    option_a TEXT,
-                    option_b TEXT,
-                    option_c TEXT,
-                    option_d TEXT,
-                    correct_option TEXT
-                );
-            """)
+            rows = await conn.fetch("SELECT telegram_id FROM admins")
+        self.admin_ids = {row['telegram_id'] for row in rows}
 
-    async def add_question(self, topic, question, a, b, c, d, correct):
+    # Применение миграций из каталога migrations/ по порядку номеров.
+    # Применённые версии хранятся в schema_migrations. Файл, начинающийся
+    # со строки "-- no-transaction", выполняется по одной команде вне
+    # транзакции (нужно для CREATE INDEX CONCURRENTLY).
+    async def migrate(self):
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO questions (topic, question, option_a, option_b, option_c, option_d, correct_option)
-                VALUES ($1, $2, $3, $4, $5, $6, $7)
-            """, topic, question, a, b, c, d, correct)
+            # Несколько процессов бота не должны мигрировать одновременно.
+            # Ждём блокировку в Python, а не в pg_advisory_lock: заблокированный запрос
+            # держит снимок, а CREATE INDEX CONCURRENTLY ждёт все старые снимки — взаимная блокировка
+            while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATIONS_LOCK_ID):
+                await asyncio.sleep(MIGRATIONS_LOCK_RETRY)
+            try:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    )
+                """)
+                applied = {row['version'] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+
+                for version, name, path in load_migrations():
+                    if version in applied:
+                        continue
+                    with open(path, encoding="utf-8") as f:
+                        sql = f.read()
+
+                    if sql.startswith(NO_TRANSACTION_MARK):
+                        for statement in split_sql(sql):
+                            await conn.execute(statement)
+                        await conn.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name
+                        )
+                    else:
+                        async with conn.transaction():
+                            await conn.execute(sql)
+                            await conn.execute(
+                                "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name
+                            )
+                    print(f"✅ Миграция {name} применена")
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_ID)
+
+    async def add_question(self, topic, question, a, b, c, d, correct, media_file_id=None):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO questions (topic, question, option_a, option_b, option_c, option_d, correct_option, media_file_id)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                """, topic, question, a, b, c, d, correct, media_file_id)
+                await conn.execute("SELECT pg_notify($1, '')", QUESTIONS_CHANNEL)
+        self.question_cache.invalidate()
+
+    # Массовая загрузка вопросов: COPY во временную таблицу и вставка только новых
+    # (по паре тема + текст вопроса) в одной транзакции. records — список или
+    # асинхронный итератор записей (тогда COPY идёт потоком). Возвращает число добавленных.
+    async def import_questions(self, records):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    CREATE TEMP TABLE questions_import (
+                        topic TEXT,
+                        question TEXT,
+                        option_a TEXT,
+                        option_b TEXT,
+                        option_c TEXT,
+                        option_d TEXT,
+                        correct_option TEXT,
+                        media_path TEXT
+                    ) ON COMMIT DROP
+                """)
+                await conn.copy_records_to_table("questions_import", records=records)
+                result = await conn.execute("""
+                    INSERT INTO questions (topic, question, option_a, option_b, option_c, option_d, correct_option, media_path)
+                    SELECT DISTINCT ON (i.topic, i.question)
+                        i.topic, i.question, i.option_a, i.option_b, i.option_c, i.option_d, i.correct_option, i.media_path
+                    FROM questions_import i
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM questions q
+                        WHERE q.question = i.question AND q.topic = i.topic
+                    )
+                """)
+                inserted = int(result.split()[-1])
+                if inserted:
+                    await conn.execute("SELECT pg_notify($1, '')", QUESTIONS_CHANNEL)
+        if inserted:
+            self.question_cache.invalidate()
+        return inserted
+
+    # Проверка роли без запроса к базе — по загруженному списку
+    def is_admin_cached(self, telegram_id):
+        return telegram_id in self.admin_ids
 
     async def is_admin(self, telegram_id):
+        return self.is_admin_cached(telegram_id)
+
+    # Потоковая выгрузка таблицы: строки читаются серверным курсором пачками по chunk_size,
+    # в памяти одновременно не больше одной пачки
+    async def iter_export(self, kind, chunk_size):
         async with self.pool.acquire() as conn:
-            result = await conn.fetchrow("SELECT * FROM admins WHERE telegram_id = $1", telegram_id)
-            return result is not None
+            async with conn.transaction():
+                cursor = await conn.cursor(EXPORT_QUERIES[kind])
+                while True:
+                    rows = await cursor.fetch(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    # Страница вопросов по ключу (keyset): after_id — листаем вперёд, before_id — назад.
+    # Берём на одну строку больше, чтобы узнать, есть ли ещё страница в ту же сторону.
+    async def get_questions_page(self, limit, after_id=0, before_id=None, topic=None):
+        conditions = []
+        args = []
+        if before_id is not None:
+            args.append(before_id)
+            conditions.append(f"id < ${len(args)}")
+            order = "DESC"
+        else:
+            args.append(after_id)
+            conditions.append(f"id > ${len(args)}")
+            order = "ASC"
+        if topic is not None:
+            args.append(topic)
+            conditions.append(f"topic = ${len(args)}")
+        args.append(limit + 1)
 
-    async def get_question(self):
         async with self.pool.acquire() as conn:
-            result = await conn.fetch("""
-                SELECT question,correct_option
+            rows = await conn.fetch(f"""
+                SELECT id, topic, question, correct_option
                 FROM questions
-            """)
-            return result
+                WHERE {" AND ".join(conditions)}
+                ORDER BY id {order}
+                LIMIT ${len(args)}
+            """, *args)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before_id is not None:
+            rows.reverse()
+        return rows, has_more
 
+    # Удаление по тексту; возвращает число удалённых вопросов
     async def delete_question(self, question_text):
         async with self.pool.acquire() as conn:
             # Удаляем вопрос по тексту
-            result = await conn.execute("""
-                DELETE FROM questions WHERE question = $1
-            """, question_text)
-            return result
+            async with conn.transaction():
+                result = await conn.execute("""
+                    DELETE FROM questions WHERE question = $1
+                """, question_text)
+                deleted = int(result.split()[-1])
+                if deleted:
+                    await conn.execute("SELECT pg_notify($1, '')", QUESTIONS_CHANNEL)
+        if deleted:
+            self.question_cache.invalidate()
+        return deleted
+
+    # Удаление по id; возвращает число удалённых вопросов (0 или 1)
+    async def delete_question_by_id(self, question_id):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                result = await conn.execute("DELETE FROM questions WHERE id = $1", question_id)
+                deleted = int(result.split()[-1])
+                if deleted:
+                    await conn.execute("SELECT pg_notify($1, '')", QUESTIONS_CHANNEL)
+        if deleted:
+            self.question_cache.invalidate()
+        return deleted
 
+    # Изменение одного поля вопроса; field — только из QUESTION_FIELDS
+    async def update_question(self, question_id, field, value):
+        if field not in QUESTION_FIELDS:
+            raise ValueError(f"Нельзя изменить поле {field}")
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                result = await conn.execute(f"UPDATE questions SET {field} = $2 WHERE id = $1", question_id, value)
+                updated = int(result.split()[-1])
+                if updated:
+                    await conn.execute("SELECT pg_notify($1, '')", QUESTIONS_CHANNEL)
+        if updated:
+            self.question_cache.invalidate()
+        return updated
+
+    # Поиск по фрагменту текста (триграммный индекс questions_question_trgm_idx):
+    # точные вхождения и похожие по словам, самые похожие первыми
+    async def search_questions(self, text, limit):
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        async with self.pool.acquire() as conn:
+            return await conn.fetch("""
+                SELECT id, topic, question, correct_option, word_similarity($1, question) AS score
+                FROM questions
+                WHERE question ILIKE $2 OR $1 <% question
+                ORDER BY score DESC, id
+                LIMIT $3
+            """, text, pattern, limit)
+
+    # Список тем отдаётся из кэша; в базу идём только после инвалидации
     async def get_topics(self):
+        topics = self.question_cache.get_topics()
+        if topics is not None:
+            return topics
+
+        version = self.question_cache.version
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT DISTINCT topic FROM questions")
-            return [row['topic'] for row in rows]
+            rows = await conn.fetch("SELECT DISTINCT topic FROM questions ORDER BY topic")
+        topics = tuple(row['topic'] for row in rows)
+        self.question_cache.set_topics(topics, version)
+        return topics
 
-    async def get_questions_by_topic(self, topic):
+    # id вопросов темы (index-only scan по questions_topic_idx), из кэша
+    async def get_topic_question_ids(self, topic):
+        ids = self.question_cache.get_topic_ids(topic)
+        if ids is not None:
+            return ids
+
+        version = self.question_cache.version
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT id FROM questions WHERE topic = $1 ORDER BY id", topic)
+        ids = tuple(row['id'] for row in rows)
+        self.question_cache.set_topic_ids(topic, ids, version)
+        return ids
+
+    # Вопросы по списку id: из кэша, недостающие — одним запросом.
+    # Удалённые вопросы в результат не попадают.
+    async def get_questions_by_ids(self, ids):
+        found = {}
+        missing = []
+        for question_id in ids:
+            question = self.question_cache.get_question(question_id)
+            if question is None:
+                missing.append(question_id)
+            else:
+                found[question_id] = question
+        if not missing:
+            return found
+
+        version = self.question_cache.version
         async with self.pool.acquire() as conn:
             rows = await conn.fetch("""
-                SELECT question, option_a, option_b, option_c, option_d, correct_option
+                SELECT id, topic, question, option_a, option_b, option_c, option_d, correct_option,
+                       media_file_id, media_path
                 FROM questions
-                WHERE topic = $1
-            """, topic)
-            return rows
+                WHERE id = ANY($1::int[])
+            """, missing)
+        questions = [Question(*row) for row in rows]
+        self.question_cache.put_questions(questions, version)
+        for question in questions:
+            found[question.id] = question
+        return found
 
-    # Сохранение результата теста
-    async def update_user_stats(self, telegram_id, correct_answers):
+    async def get_question_by_id(self, question_id):
+        questions = await self.get_questions_by_ids([question_id])
+        return questions.get(question_id)
+
+    # file_id картинки после первой загрузки: дальше она отправляется без повторной загрузки.
+    # Кэш вопросов обновляется на месте — сбрасывать его целиком ради этого не нужно.
+    async def set_question_file_id(self, question_id, file_id):
         async with self.pool.acquire() as conn:
-            user = await conn.fetchrow("SELECT * FROM user_stats WHERE telegram_id = $1", telegram_id)
-            if user:
-                await conn.execute("""
-                    UPDATE user_stats
-                    SET total_tests = total_tests + 1,
-                        correct_answers = correct_answers + $2
-                    WHERE telegram_id = $1
-                """, telegram_id, correct_answers)
-            else:
-                await conn.execute("""
+            await conn.execute("""
+                UPDATE questions SET media_file_id = $2 WHERE id = $1
+            """, question_id, file_id)
+        question = self.question_cache.by_id.get(question_id)
+        if question is not None:
+            self.question_cache.replace_question(question._replace(media_file_id=file_id))
+
+    # Пакетное сохранение статистики в одной транзакции:
+    # rows — список (telegram_id, тестов, правильных ответов),
+    # topic_rows — список (telegram_id, тема, тестов, правильных ответов).
+    # Возвращает итоговые значения по каждому пользователю и паре пользователь+тема;
+    # после фиксации они передаются подписчикам из stats_listeners (рейтинг).
+    async def add_user_stats_bulk(self, rows, topic_rows=()):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                totals = await conn.fetch("""
                     INSERT INTO user_stats (telegram_id, total_tests, correct_answers)
-                    VALUES ($1, 1, $2)
-                """, telegram_id, correct_answers)
+                    SELECT * FROM unnest($1::bigint[], $2::int[], $3::int[])
+                    ON CONFLICT (telegram_id) DO UPDATE
+                    SET total_tests = user_stats.total_tests + EXCLUDED.total_tests,
+                        correct_answers = user_stats.correct_answers + EXCLUDED.correct_answers
+                    RETURNING telegram_id, total_tests, correct_answers
+                """, [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows])
+
+                topic_totals = []
+                if topic_rows:
+                    topic_totals = await conn.fetch("""
+                        INSERT INTO user_topic_stats (telegram_id, topic, total_tests, correct_answers)
+                        SELECT * FROM unnest($1::bigint[], $2::text[], $3::int[], $4::int[])
+                        ON CONFLICT (telegram_id, topic) DO UPDATE
+                        SET total_tests = user_topic_stats.total_tests + EXCLUDED.total_tests,
+                            correct_answers = user_topic_stats.correct_answers + EXCLUDED.correct_answers
+                        RETURNING telegram_id, topic, total_tests, correct_answers
+                    """, [row[0] for row in topic_rows], [row[1] for row in topic_rows],
+                        [row[2] for row in topic_rows], [row[3] for row in topic_rows])
+
+        for listener in self.stats_listeners:
+            listener(totals, topic_totals)
+        return totals, topic_totals
+
+    # Лучшие пользователи (по индексу user_stats_rank_idx / user_topic_stats_rank_idx)
+    async def get_top_users(self, limit, topic=None):
+        async with self.pool.acquire() as conn:
+            if topic is None:
+                return await conn.fetch("""
+                    SELECT telegram_id, correct_answers FROM user_stats
+                    ORDER BY correct_answers DESC
+                    LIMIT $1
+                """, limit)
+            return await conn.fetch("""
+                SELECT telegram_id, correct_answers FROM user_topic_stats
+                WHERE topic = $1
+                ORDER BY correct_answers DESC
+                LIMIT $2
+            """, topic, limit)
+
+    # Результат пользователя и его место: число пользователей с большим результатом + 1
+    async def get_user_rank(self, telegram_id, topic=None):
+        async with self.pool.acquire() as conn:
+            if topic is None:
+                return await conn.fetchrow("""
+                    SELECT s.correct_answers,
+                           (SELECT count(*) + 1 FROM user_stats WHERE correct_answers > s.correct_answers) AS rank
+                    FROM user_stats s
+                    WHERE s.telegram_id = $1
+                """, telegram_id)
+            return await conn.fetchrow("""
+                SELECT s.correct_answers,
+                       (SELECT count(*) + 1 FROM user_topic_stats
+                        WHERE topic = s.topic AND correct_answers > s.correct_answers) AS rank
+                FROM user_topic_stats s
+                WHERE s.telegram_id = $1 AND s.topic = $2
+            """, telegram_id, topic)
 
     # Получение статистики пользователя
     async def get_user_stats(self, telegram_id):
@@ -111,6 +576,89 @@ class Database:
                 WHERE telegram_id = $1
             """, telegram_id)
 
+    # Доля верных ответов по дням и темам за последние days дней (для графика прогресса)
+    async def get_user_progress(self, telegram_id, days):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch("""
+                SELECT topic, created_at::date AS day, count(*) AS answers, sum(is_correct::int) AS correct
+                FROM answer_events
+                WHERE telegram_id = $1 AND created_at > now() - make_interval(days => $2)
+                GROUP BY topic, day
+                ORDER BY day
+            """, telegram_id, days)
+
+    # Секция журнала ответов за месяц; создаётся один раз на процесс.
+    # Отдельно от транзакции записи: параллельное создание другим процессом не должно её откатывать.
+    async def _ensure_answer_partition(self, conn, year, month):
+        if (year, month) in self.answer_partitions:
+            return
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        # Месяц считается по UTC (см. AnswerLog.add), поэтому и границы — явно в UTC,
+        # а не в часовом поясе сессии базы
+        try:
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS answer_events_{year}_{month:02d}
+                PARTITION OF answer_events
+                FOR VALUES FROM ('{year}-{month:02d}-01 00:00+00') TO ('{next_year}-{next_month:02d}-01 00:00+00')
+            """)
+        except asyncpg.DuplicateTableError:
+            pass
+        except (asyncpg.InvalidObjectDefinitionError, asyncpg.CheckViolationError) as e:
+            # Пересечение со старой секцией (созданной с границами в поясе сессии) или строки
+            # этого месяца уже в секции по умолчанию: пишем в существующие секции
+            print(f"⚠️ Секция журнала ответов {year}-{month:02d} не создана: {e}")
+        self.answer_partitions.add((year, month))
+
+    # Запись пачки ответов: COPY в журнал и обновление счётчиков по вопросам в одной транзакции.
+    # events — (время, telegram_id, id вопроса, тема, выбранный вариант, верно ли),
+    # question_rows — (id вопроса, попыток, верных, выбрано A, B, C, D).
+    async def add_answer_events(self, events, question_rows):
+        async with self.pool.acquire() as conn:
+            for year, month in {(event[0].year, event[0].month) for event in events}:
+                await self._ensure_answer_partition(conn, year, month)
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    "answer_events",
+                    records=events,
+                    columns=["created_at", "telegram_id", "question_id", "topic", "chosen", "is_correct"],
+                )
+                columns = list(zip(*question_rows))
+                await conn.execute("""
+                    INSERT INTO question_stats (question_id, attempts, correct, chosen_a, chosen_b, chosen_c, chosen_d)
+                    SELECT * FROM unnest($1::int[], $2::int[], $3::int[], $4::int[], $5::int[], $6::int[], $7::int[])
+                    ON CONFLICT (question_id) DO UPDATE
+                    SET attempts = question_stats.attempts + EXCLUDED.attempts,
+                        correct = question_stats.correct + EXCLUDED.correct,
+                        chosen_a = question_stats.chosen_a + EXCLUDED.chosen_a,
+                        chosen_b = question_stats.chosen_b + EXCLUDED.chosen_b,
+                        chosen_c = question_stats.chosen_c + EXCLUDED.chosen_c,
+                        chosen_d = question_stats.chosen_d + EXCLUDED.chosen_d
+                """, *[list(column) for column in columns])
+
+    # Самые трудные вопросы: наименьшая доля верных ответов среди вопросов с достаточным числом попыток
+    async def get_question_report(self, limit, min_attempts, topic=None):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch("""
+                SELECT q.id, q.topic, q.question, q.correct_option,
+                       s.attempts, s.correct, s.chosen_a, s.chosen_b, s.chosen_c, s.chosen_d
+                FROM question_stats s
+                JOIN questions q ON q.id = s.question_id
+                WHERE s.attempts >= $1 AND ($2::text IS NULL OR q.topic = $2)
+                ORDER BY s.correct::float / s.attempts, s.attempts DESC
+                LIMIT $3
+            """, min_attempts, topic, limit)
+
+    # Пользователи для рассылки, страницами по ключу (telegram_id > after_id)
+    async def get_user_ids_page(self, after_id, limit):
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT telegram_id FROM user_stats
+                WHERE telegram_id > $1
+                ORDER BY telegram_id
+                LIMIT $2
+            """, after_id, limit)
+        return [row['telegram_id'] for row in rows]
+
     # Добавление нового администратора
     async def add_admin(self, telegram_id):
         async with self.pool.acquire() as conn:
@@ -120,19 +668,31 @@ class Database:
                 return "❌ Этот пользователь уже является администратором."
             
             # Добавляем пользователя как администратора
-            await conn.execute("""
-                INSERT INTO admins (telegram_id, username)
-                VALUES ($1, $2)
-            """, telegram_id, None)  # Возможно, вам нужно будет передать username или оставить None
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO admins (telegram_id, username)
+                    VALUES ($1, $2)
+                """, telegram_id, None)  # Возможно, вам нужно будет передать username или оставить None
+                await conn.execute("SELECT pg_notify($1, $2)", ADMINS_CHANNEL, f"+{telegram_id}")
+        self.admin_ids.add(telegram_id)
 
     # Удаление администратора
     async def remove_admin(self, telegram_id):
         async with self.pool.acquire() as conn:
             # Удаляем администратора
-            await conn.execute("""
-                DELETE FROM admins WHERE telegram_id = $1
-            """, telegram_id)
+            async with conn.transaction():
+                await conn.execute("""
+                    DELETE FROM admins WHERE telegram_id = $1
+                """, telegram_id)
+                await conn.execute("SELECT pg_notify($1, $2)", ADMINS_CHANNEL, f"-{telegram_id}")
+        self.admin_ids.discard(telegram_id)
+
+
 
+# Замер времени и числа строк для всех публичных методов
+for _name, _method in list(vars(Database).items()):
+    if not _name.startswith("_") and inspect.iscoroutinefunction(_method):
+        setattr(Database, _name, observe_query(_method))
 
 
 # Глобальный объект базы данных
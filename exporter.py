@@ -0,0 +1,71 @@
+# exporter.py
+import asyncio
+import csv
+
+# Форматы выгрузки
+EXPORT_FORMATS = ("xlsx", "csv")
+# Строк на листе XLSX; дальше XlsxWriter молча не пишет (write_row возвращает -1)
+XLSX_MAX_ROWS = 1_048_576
+
+
+class CsvExport:
+    def __init__(self, path):
+        # utf-8-sig — чтобы Excel правильно открыл кириллицу
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.file)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class XlsxExport:
+    def __init__(self, path):
+        import xlsxwriter
+
+        # constant_memory — каждая строка сбрасывается на диск сразу после записи,
+        # память не растёт с размером листа (строки пишутся строго по порядку)
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        self.worksheet = self.workbook.add_worksheet()
+        self.row = 0
+        self.header = None
+
+    # Первая строка — заголовок; когда лист заполнен, продолжаем на новом с тем же заголовком
+    def write_rows(self, rows):
+        for row in rows:
+            if self.row >= XLSX_MAX_ROWS:
+                self.worksheet = self.workbook.add_worksheet()
+                self.worksheet.write_row(0, 0, self.header)
+                self.row = 1
+            if self.worksheet.write_row(self.row, 0, row) == -1:
+                raise ValueError(f"строка {self.row + 1} не записана в XLSX, выгрузите в csv")
+            if self.header is None:
+                self.header = row
+            self.row += 1
+
+    def close(self):
+        self.workbook.close()
+
+
+EXPORT_WRITERS = {"xlsx": XlsxExport, "csv": CsvExport}
+
+
+# Запись пачек строк из асинхронного источника в файл. Файловые операции идут
+# в отдельном потоке, поэтому цикл событий не блокируется; в памяти держится
+# только текущая пачка. Возвращает число выгруженных строк.
+async def export_rows(chunks, path, fmt):
+    writer = None
+    count = 0
+    try:
+        async for rows in chunks:
+            if writer is None:
+                writer = await asyncio.to_thread(EXPORT_WRITERS[fmt], path)
+                await asyncio.to_thread(writer.write_rows, [list(rows[0].keys())])
+            await asyncio.to_thread(writer.write_rows, [tuple(row.values()) for row in rows])
+            count += len(rows)
+    finally:
+        if writer is not None:
+            await asyncio.to_thread(writer.close)
+    return count
@@ -0,0 +1,11 @@
+# filters.py
+from aiogram.filters import BaseFilter
+from aiogram.types import TelegramObject
+from database import db
+
+
+# Фильтр для админских хендлеров: роль берётся из списка в памяти, без запроса к базе
+class IsAdmin(BaseFilter):
+    async def __call__(self, event: TelegramObject) -> bool:
+        user = getattr(event, "from_user", None)
+        return user is not None and db.is_admin_cached(user.id)
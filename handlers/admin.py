@@ -1,6 +1,10 @@
 # admin.py
+import asyncio
+import os
+import tempfile
+from contextlib import aclosing
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import CommandStart
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
@@ -8,10 +12,26 @@ from aiogram.types import ReplyKeyboardRemove
 from database import db  # Используем глобальный объект базы данных
 from keyboards import admin_panel_kb
 from keyboards import user_panel_kb
+from keyboards import QuestionsPage, questions_page_kb
+from keyboards import QuestionAction, EDIT_FIELDS, search_results_kb, confirm_delete_kb, edit_fields_kb
+from config import QUESTIONS_PAGE_SIZE, EXPORT_CHUNK_SIZE
+from database import EXPORT_QUERIES
+from exporter import EXPORT_FORMATS, export_rows
+from importer import IMPORT_EXTENSIONS, ImportReader
+from sender import broadcast
+from media import CAPTION_LIMIT
+from analytics import most_chosen_wrong
 from aiogram.filters import Command
+from filters import IsAdmin
 
 admin_router = Router()
 
+# Ссылки на фоновые задачи (рассылки), чтобы их не собрал сборщик мусора
+background_tasks = set()
+
+# Длина вопроса в списках ограничена, чтобы страница всегда помещалась в одно сообщение
+QUESTION_PREVIEW_LEN = 200
+
 class AddQuestion(StatesGroup):
     topic = State()
     question = State()
@@ -20,6 +40,10 @@ class AddQuestion(StatesGroup):
     option_c = State()
     option_d = State()
     correct = State()
+    media = State()
+
+class EditQuestion(StatesGroup):
+    value = State()
 
 async def is_super_admin(telegram_id):
     # Проверка, что пользователь является супер-администратором
@@ -42,7 +66,7 @@ async def add_admin(msg: Message):
             
             # Отправляем сообщение новому администратору
             try:
-                await bot.send_message(new_admin_id, "🎉 Вы были добавлены в список администраторов бота!")
+                await msg.bot.send_message(new_admin_id, "🎉 Вы были добавлены в список администраторов бота!")
             except Exception as e:
                 await msg.answer(f"❌ Не удалось отправить сообщение новому администратору. Ошибка: {e}")
 
@@ -71,7 +95,7 @@ async def remove_admin(msg: Message):
 
             # Отправляем сообщение удаленному администратору
             try:
-                await bot.send_message(admin_id_to_remove, "❌ Вы были удалены из списка администраторов бота.")
+                await msg.bot.send_message(admin_id_to_remove, "❌ Вы были удалены из списка администраторов бота.")
             except Exception as e:
                 await msg.answer(f"❌ Не удалось отправить сообщение удаленному администратору. Ошибка: {e}")
 
@@ -85,10 +109,90 @@ async def remove_admin(msg: Message):
 
 
 
+# Рассылка сообщения всем пользователям бота
+@admin_router.message(Command('broadcast'), IsAdmin())
+async def broadcast_cmd(msg: Message):
+    text = msg.text.strip().split(maxsplit=1)
+    if len(text) < 2:
+        await msg.answer("❌ Пожалуйста, укажите текст рассылки. Пример:\n`/broadcast Завтра пробный ЕНТ!`")
+        return
+
+    async def run():
+        sent, failed = await broadcast(msg.bot, text[1])
+        await msg.answer(f"✅ Рассылка завершена!\nДоставлено: {sent}\nНе доставлено: {failed}")
+
+    # Рассылка идёт в фоне с низким приоритетом и не задерживает ответы другим пользователям
+    task = asyncio.create_task(run())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    await msg.answer("⏳ Рассылка запущена.")
+
+
+# Сколько вопросов показывать в отчёте и сколько нужно попыток, чтобы вопрос попал в отчёт
+REPORT_SIZE = 10
+REPORT_MIN_ATTEMPTS = 5
+
+# Отчёт по трудным вопросам: /report или /report <тема>
+@admin_router.message(Command('report'), IsAdmin())
+async def question_report(msg: Message):
+    text = msg.text.strip().split(maxsplit=1)
+    topic = text[1] if len(text) > 1 else None
+
+    rows = await db.get_question_report(REPORT_SIZE, REPORT_MIN_ATTEMPTS, topic)
+    if not rows:
+        await msg.answer("Пока недостаточно ответов для отчёта.")
+        return
+
+    lines = ["📊 Самые трудные вопросы:" if topic is None else f"📊 Самые трудные вопросы ({topic}):", ""]
+    for row in rows:
+        question = row['question']
+        if len(question) > QUESTION_PREVIEW_LEN:
+            question = question[:QUESTION_PREVIEW_LEN] + "…"
+        percent = round(100 * row['correct'] / row['attempts'])
+        line = f"#{row['id']} \"{question}\"\nОтветов: {row['attempts']}, верно: {percent}%"
+        wrong, count = most_chosen_wrong(row)
+        if wrong is not None:
+            line += f", чаще всего ошибаются на {wrong} ({count})"
+        lines.append(line + "\n")
+    await msg.answer("\n".join(lines))
+
+
+# Выгрузка в файл: /export questions|stats [xlsx|csv]
+@admin_router.message(Command('export'), IsAdmin())
+async def export_cmd(msg: Message):
+    args = msg.text.strip().split()[1:]
+    kind = args[0].lower() if args else ""
+    fmt = args[1].lower() if len(args) > 1 else "xlsx"
+    if kind not in EXPORT_QUERIES or fmt not in EXPORT_FORMATS:
+        await msg.answer("❌ Пример: /export questions или /export stats csv\nФорматы: xlsx (по умолчанию), csv.")
+        return
+
+    async def run():
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+        os.close(fd)
+        try:
+            # aclosing — при ошибке записи курсор закрывается и соединение сразу возвращается в пул
+            async with aclosing(db.iter_export(kind, EXPORT_CHUNK_SIZE)) as chunks:
+                count = await export_rows(chunks, path, fmt)
+            if count:
+                await msg.answer_document(FSInputFile(path, filename=f"{kind}.{fmt}"), caption=f"✅ Выгружено строк: {count}")
+            else:
+                await msg.answer("Нечего выгружать: таблица пуста.")
+        except Exception as e:
+            await msg.answer(f"❌ Не удалось выгрузить данные. Ошибка: {e}")
+        finally:
+            os.remove(path)
+
+    # Выгрузка большой таблицы идёт в фоне и не задерживает остальные обновления
+    task = asyncio.create_task(run())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    await msg.answer("⏳ Готовлю файл...")
+
 # Стартовое сообщение и проверка админа
 @admin_router.message(CommandStart())
 async def start_handler(msg: Message):
-    if await db.is_admin(msg.from_user.id):
+    if db.is_admin_cached(msg.from_user.id):
         await msg.answer("Добро пожаловать в админ-панель!", reply_markup=admin_panel_kb())
     else:
         await msg.answer("Добро пожаловать! Выберите действие👇", reply_markup=user_panel_kb())
@@ -96,26 +200,115 @@ async def start_handler(msg: Message):
 @admin_router.message(Command('delete'))
 async def del_msg(msg: Message):
     # Проверка: админ ли пользователь
-    if not await db.is_admin(msg.from_user.id):
+    if not db.is_admin_cached(msg.from_user.id):
         await msg.answer("❌ У вас нет прав для удаления вопросов.")
         return
 
     text = msg.text.strip().split(maxsplit=1)
     if len(text) > 1:
-        command_text = text[1]  # Текст вопроса для удаления
-        result = await db.delete_question(command_text)
+        command_text = text[1]  # id или текст вопроса для удаления
+        if command_text.isdigit():
+            deleted = await db.delete_question_by_id(int(command_text))
+        else:
+            deleted = await db.delete_question(command_text)
 
-        if result and "DELETE" in result:
-            await msg.answer(f"✅ Вопрос '{command_text}' был удален из базы данных.")
+        if deleted:
+            await msg.answer(f"✅ Вопрос '{command_text}' был удален из базы данных. Удалено: {deleted}")
         else:
             await msg.answer("❌ Не удалось найти такой вопрос для удаления.")
     else:
-        await msg.answer("❌ Пожалуйста, укажите текст вопроса, который нужно удалить. Пример:\n`/delete Какой город столица Казахстана?`")
+        await msg.answer("❌ Пожалуйста, укажите id или текст вопроса, который нужно удалить. Пример:\n`/delete 42`\n`/delete Какой город столица Казахстана?`")
+
+
+# Сколько результатов поиска показывать
+SEARCH_LIMIT = 10
 
+# Поиск вопросов по фрагменту текста с кнопками удаления и редактирования
+@admin_router.message(Command('search'), IsAdmin())
+async def search_questions(msg: Message):
+    text = msg.text.strip().split(maxsplit=1)
+    if len(text) < 2:
+        await msg.answer("❌ Пожалуйста, укажите текст для поиска. Пример:\n`/search столица Казахстана`")
+        return
 
-# Проверка прав администратора
+    rows = await db.search_questions(text[1], SEARCH_LIMIT)
+    if not rows:
+        await msg.answer("Ничего не найдено.")
+        return
+
+    lines = ["🔎 Найденные вопросы:", ""]
+    for row in rows:
+        question = row['question']
+        if len(question) > QUESTION_PREVIEW_LEN:
+            question = question[:QUESTION_PREVIEW_LEN] + "…"
+        lines.append(f"#{row['id']} [{row['topic']}] \"{question}\" - {row['correct_option']}")
+    await msg.answer("\n".join(lines), reply_markup=search_results_kb(rows))
+
+@admin_router.callback_query(QuestionAction.filter(F.a == "del"), IsAdmin())
+async def ask_delete_question(callback: CallbackQuery, callback_data: QuestionAction):
+    await callback.answer()
+    await callback.message.answer(
+        f"Удалить вопрос #{callback_data.id}?", reply_markup=confirm_delete_kb(callback_data.id)
+    )
+
+@admin_router.callback_query(QuestionAction.filter(F.a == "del_ok"), IsAdmin())
+async def confirm_delete_question(callback: CallbackQuery, callback_data: QuestionAction):
+    deleted = await db.delete_question_by_id(callback_data.id)
+    await callback.answer()
+    if deleted:
+        await callback.message.edit_text(f"✅ Вопрос #{callback_data.id} удален. Удалено: {deleted}")
+    else:
+        await callback.message.edit_text(f"❌ Вопрос #{callback_data.id} не найден — возможно, уже удален.")
+
+@admin_router.callback_query(QuestionAction.filter(F.a == "cancel"), IsAdmin())
+async def cancel_question_action(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await callback.answer()
+    await callback.message.edit_text("Отменено.")
+
+@admin_router.callback_query(QuestionAction.filter(F.a == "edit"), IsAdmin())
+async def choose_edit_field(callback: CallbackQuery, callback_data: QuestionAction):
+    await callback.answer()
+    await callback.message.answer(
+        f"Что изменить в вопросе #{callback_data.id}?", reply_markup=edit_fields_kb(callback_data.id)
+    )
+
+@admin_router.callback_query(QuestionAction.filter(F.a == "field"), IsAdmin())
+async def ask_edit_value(callback: CallbackQuery, callback_data: QuestionAction, state: FSMContext):
+    await callback.answer()
+    if callback_data.f not in EDIT_FIELDS:
+        return
+    await state.update_data(edit_id=callback_data.id, edit_field=callback_data.f)
+    await state.set_state(EditQuestion.value)
+    await callback.message.edit_text(
+        f"Введите новое значение поля «{EDIT_FIELDS[callback_data.f]}» для вопроса #{callback_data.id}:"
+    )
+
+@admin_router.message(EditQuestion.value, IsAdmin())
+async def save_edit_value(msg: Message, state: FSMContext):
+    data = await state.get_data()
+    field = data['edit_field']
+    value = (msg.text or "").strip()
+    if field == "correct_option":
+        value = value.upper()
+        if value not in ["A", "B", "C", "D"]:
+            await msg.answer("Введите только A, B, C или D.")
+            return
+    if not value:
+        await msg.answer("Значение не может быть пустым.")
+        return
+
+    updated = await db.update_question(data['edit_id'], field, value)
+    await state.clear()
+    if updated:
+        await msg.answer(f"✅ Вопрос #{data['edit_id']} изменен.", reply_markup=admin_panel_kb())
+    else:
+        await msg.answer(f"❌ Вопрос #{data['edit_id']} не найден.", reply_markup=admin_panel_kb())
+
+
+# Проверка прав администратора (по списку в памяти, без запроса к базе)
 async def is_admin(msg: Message):
-    return await db.is_admin(msg.from_user.id)
+    return db.is_admin_cached(msg.from_user.id)
 
 # Обработка кнопки "📥 Добавить вопрос"
 @admin_router.message(F.text == "📥 Добавить вопрос")
@@ -126,98 +319,177 @@ async def add_question_start(msg: Message, state: FSMContext):
     else:
         await msg.answer("У вас нет прав для добавления вопроса.")
 
+async def render_questions_page(after_id=0, before_id=None, topic=None):
+    rows, has_more = await db.get_questions_page(QUESTIONS_PAGE_SIZE, after_id, before_id, topic)
+    if not rows:
+        return None, None
+
+    lines = ["Сұрақтар және жауабы:" if topic is None else f"Сұрақтар ({topic}):", ""]
+    for row in rows:
+        question = row['question']
+        if len(question) > QUESTION_PREVIEW_LEN:
+            question = question[:QUESTION_PREVIEW_LEN] + "…"
+        lines.append(f"#{row['id']} \"{question}\" - {row['correct_option']}")
+
+    # Листая вперёд, страница позади есть всегда, если курсор не с начала, и наоборот
+    if before_id is not None:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after_id > 0, has_more
+    markup = questions_page_kb(rows[0]['id'], rows[-1]['id'], has_prev, has_next)
+    return "\n".join(lines), markup
+
+async def send_questions_page(msg: Message, state: FSMContext, topic=None):
+    # Фильтр по теме запоминаем для кнопок листания
+    await state.update_data(browse_topic=topic)
+    text, markup = await render_questions_page(topic=topic)
+    if text:
+        await msg.answer(text, reply_markup=markup)
+    else:
+        await msg.answer("Нет вопросов в базе данных.", reply_markup=admin_panel_kb())
+
 @admin_router.message(F.text == "📄 Посмотреть все вопросы")
-async def view_all_questions(msg: Message):
+async def view_all_questions(msg: Message, state: FSMContext):
     if await is_admin(msg):
-        questions = await db.get_question()
-        if questions:
-            message = "Сұрақтар және жауабы:\n\n"
-            for question in questions:
-                message += f"\"{question['question']}\" - {question['correct_option']}\n"
-            print(len(questions), (questions))
-            await msg.answer(message)
-        else:
-            await msg.answer("Нет вопросов в базе данных.", reply_markup=admin_panel_kb())
+        await send_questions_page(msg, state)
     else:
         await msg.answer("У вас нет прав для просмотра вопросов.")
 
-@admin_router.message(AddQuestion.topic)
-async def get_topic(msg: Message, state: FSMContext):
-    if await is_admin(msg):
-        await state.update_data(topic=msg.text)
-        await msg.answer("Введите сам вопрос:")
-        await state.set_state(AddQuestion.question)
+# /questions <тема> — список вопросов одной темы
+@admin_router.message(Command('questions'), IsAdmin())
+async def view_topic_questions(msg: Message, state: FSMContext):
+    text = msg.text.strip().split(maxsplit=1)
+    topic = text[1] if len(text) > 1 else None
+    await send_questions_page(msg, state, topic)
+
+@admin_router.callback_query(QuestionsPage.filter(), IsAdmin())
+async def turn_questions_page(callback: CallbackQuery, callback_data: QuestionsPage, state: FSMContext):
+    topic = (await state.get_data()).get("browse_topic")
+    if callback_data.d == "next":
+        text, markup = await render_questions_page(after_id=callback_data.c, topic=topic)
     else:
-        await msg.answer("У вас нет прав для добавления вопроса.")
+        text, markup = await render_questions_page(before_id=callback_data.c, topic=topic)
+    await callback.answer()
+    if text:
+        await callback.message.edit_text(text, reply_markup=markup)
+
+@admin_router.message(F.text == "📤 Импорт вопросов", IsAdmin())
+async def import_help(msg: Message):
+    await msg.answer(
+        "Отправьте файл CSV, JSON (JSON Lines) или XLSX с колонками:\n"
+        "topic, question, option_a, option_b, option_c, option_d, correct_option\n"
+        "и необязательной колонкой image — путь к картинке в каталоге MEDIA_DIR\n\n"
+        "correct_option — буква A, B, C или D. Вопросы, которые уже есть в этой теме, пропускаются."
+    )
+
+# Загрузка банка вопросов файлом
+@admin_router.message(F.document, IsAdmin())
+async def import_questions(msg: Message):
+    filename = msg.document.file_name or ""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in IMPORT_EXTENSIONS:
+        await msg.answer("❌ Поддерживаются только файлы CSV, JSON и XLSX.")
+        return
 
-@admin_router.message(AddQuestion.question)
+    await msg.answer("⏳ Загружаю вопросы...")
+    fd, path = tempfile.mkstemp(suffix=extension)
+    os.close(fd)
+    try:
+        await msg.bot.download(msg.document, destination=path)
+        # Разбор файла — пачками в отдельном потоке, чтобы не блокировать остальных
+        # пользователей; записи идут в COPY по мере разбора, не накапливаясь в памяти
+        reader = ImportReader(path)
+        inserted = await db.import_questions(reader.records())
+    except Exception as e:
+        await msg.answer(f"❌ Не удалось загрузить файл. Ошибка: {e}")
+        return
+    finally:
+        os.remove(path)
+
+    await msg.answer(
+        f"✅ Импорт завершен!\n\n"
+        f"Добавлено: {inserted}\n"
+        f"Пропущено (дубликаты): {reader.valid - inserted}\n"
+        f"Пропущено (ошибки в строке): {reader.invalid}",
+        reply_markup=admin_panel_kb()
+    )
+
+@admin_router.message(AddQuestion.topic, IsAdmin())
+async def get_topic(msg: Message, state: FSMContext):
+    await state.update_data(topic=msg.text)
+    await msg.answer("Введите сам вопрос:")
+    await state.set_state(AddQuestion.question)
+
+@admin_router.message(AddQuestion.question, IsAdmin())
 async def get_question(msg: Message, state: FSMContext):
-    if await is_admin(msg):
-        await state.update_data(question=msg.text)
-        await msg.answer("Вариант A:")
-        await state.set_state(AddQuestion.option_a)
-    else:
-        await msg.answer("У вас нет прав для добавления вопроса.")
+    await state.update_data(question=msg.text)
+    await msg.answer("Вариант A:")
+    await state.set_state(AddQuestion.option_a)
 
-@admin_router.message(AddQuestion.option_a)
+@admin_router.message(AddQuestion.option_a, IsAdmin())
 async def get_a(msg: Message, state: FSMContext):
-    if await is_admin(msg):
-        await state.update_data(a=msg.text)
-        await msg.answer("Вариант B:")
-        await state.set_state(AddQuestion.option_b)
-    else:
-        await msg.answer("У вас нет прав для добавления вопроса.")
+    await state.update_data(a=msg.text)
+    await msg.answer("Вариант B:")
+    await state.set_state(AddQuestion.option_b)
 
-@admin_router.message(AddQuestion.option_b)
+@admin_router.message(AddQuestion.option_b, IsAdmin())
 async def get_b(msg: Message, state: FSMContext):
-    if await is_admin(msg):
-        await state.update_data(b=msg.text)
-        await msg.answer("Вариант C:")
-        await state.set_state(AddQuestion.option_c)
-    else:
-        await msg.answer("У вас нет прав для добавления вопроса.")
+    await state.update_data(b=msg.text)
+    await msg.answer("Вариант C:")
+    await state.set_state(AddQuestion.option_c)
 
-@admin_router.message(AddQuestion.option_c)
+@admin_router.message(AddQuestion.option_c, IsAdmin())
 async def get_c(msg: Message, state: FSMContext):
-    if await is_admin(msg):
-        await state.update_data(c=msg.text)
-        await msg.answer("Вариант D:")
-        await state.set_state(AddQuestion.option_d)
-    else:
-        await msg.answer("У вас нет прав для добавления вопроса.")
+    await state.update_data(c=msg.text)
+    await msg.answer("Вариант D:")
+    await state.set_state(AddQuestion.option_d)
 
-@admin_router.message(AddQuestion.option_d)
+@admin_router.message(AddQuestion.option_d, IsAdmin())
 async def get_d(msg: Message, state: FSMContext):
-    if await is_admin(msg):
-        await state.update_data(d=msg.text)
-        await msg.answer("Укажите правильный вариант (A/B/C/D):")
-        await state.set_state(AddQuestion.correct)
-    else:
-        await msg.answer("У вас нет прав для добавления вопроса.")
+    await state.update_data(d=msg.text)
+    await msg.answer("Укажите правильный вариант (A/B/C/D):")
+    await state.set_state(AddQuestion.correct)
 
-@admin_router.message(AddQuestion.correct)
+@admin_router.message(AddQuestion.correct, IsAdmin())
 async def save_question(msg: Message, state: FSMContext):
-    if await is_admin(msg):
-        correct = msg.text.strip().upper()
-        if correct not in ["A", "B", "C", "D"]:
-            await msg.answer("Введите только A, B, C или D.")
-            return
-        await state.update_data(correct=correct)
-
-        data = await state.get_data()
-        await db.add_question(
-            topic=data['topic'],
-            question=data['question'],
-            a=data['a'],
-            b=data['b'],
-            c=data['c'],
-            d=data['d'],
-            correct=correct
-        )
-        await msg.answer("✅ Вопрос успешно добавлен!", reply_markup=admin_panel_kb())
-        await state.clear()
-    else:
-        await msg.answer("У вас нет прав для добавления вопроса.")
-
+    correct = msg.text.strip().upper()
+    if correct not in ["A", "B", "C", "D"]:
+        await msg.answer("Введите только A, B, C или D.")
+        return
+    await state.update_data(correct=correct)
+    await msg.answer("Пришлите картинку к вопросу (например, чертёж или схему) или /skip, если она не нужна:")
+    await state.set_state(AddQuestion.media)
+
+async def finish_add_question(msg: Message, state: FSMContext, media_file_id=None):
+    data = await state.get_data()
+    await db.add_question(
+        topic=data['topic'],
+        question=data['question'],
+        a=data['a'],
+        b=data['b'],
+        c=data['c'],
+        d=data['d'],
+        correct=data['correct'],
+        media_file_id=media_file_id
+    )
+    await msg.answer("✅ Вопрос успешно добавлен!", reply_markup=admin_panel_kb())
+    await state.clear()
+
+# Картинка уже загружена в Telegram — сохраняем только её file_id
+@admin_router.message(AddQuestion.media, F.photo, IsAdmin())
+async def save_question_media(msg: Message, state: FSMContext):
+    data = await state.get_data()
+    # Текст вопроса с вариантами пойдёт подписью к фото, а у подписи есть предел длины
+    text_len = len(data['question']) + sum(len(data[key]) for key in "abcd")
+    if text_len + 100 > CAPTION_LIMIT:
+        await msg.answer("❌ Вопрос слишком длинный для подписи к картинке. Сократите его или нажмите /skip.")
+        return
+    await finish_add_question(msg, state, msg.photo[-1].file_id)
 
+@admin_router.message(AddQuestion.media, Command('skip'), IsAdmin())
+async def skip_question_media(msg: Message, state: FSMContext):
+    await finish_add_question(msg, state)
 
+@admin_router.message(AddQuestion.media, IsAdmin())
+async def ask_question_media(msg: Message):
+    await msg.answer("Пришлите картинку (как фото) или /skip.")
@@ -1,13 +1,25 @@
 # user.py
-from aiogram import Router, F
+import time
+from datetime import datetime
+from functools import lru_cache
+from aiogram import Bot, Router, F
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
-from aiogram.filters import CommandStart
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
 from database import db
-from keyboards import user_panel_kb
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.types import CallbackQuery
+from keyboards import user_panel_kb, answer_kb, Answer
+from aiogram.types import CallbackQuery, BufferedInputFile, InputMediaPhoto
+from config import QUIZ_EDIT_MESSAGE, QUIZ_LENGTH, QUIZ_SHUFFLE_OPTIONS, QUIZ_QUESTION_TIME, QUIZ_TEST_TIME
+from quiz import QuizSession
+from stats import stats_buffer
+from leaderboard import leaderboard
+from analytics import answer_log
+from timers import quiz_timer
+from charts import charts, progress_series, series_key, CHART_DAYS
+from throttling import user_locks
+from media import CAPTION_LIMIT, media_uploader
 
 
 user_router = Router()
@@ -20,12 +32,13 @@ class TestQuiz(StatesGroup):
 # Команда /start для обычных пользователей
 @user_router.message(CommandStart())
 async def start_handler_user(msg: Message):
-    if not await db.is_admin(msg.from_user.id):
+    if not db.is_admin_cached(msg.from_user.id):
         await msg.answer("Добро пожаловать в тест-бот! Выберите действие👇", reply_markup=user_panel_kb())
 
 # Обработка кнопки "🧠 Пройти тест"
 @user_router.message(F.text == "🧠 Пройти тест")
 async def test_start(msg: Message, state: FSMContext):
+    quiz_timer.cancel(msg.from_user.id)
     await state.clear() 
     topics = await db.get_topics()
     if not topics:
@@ -40,6 +53,7 @@ async def test_start(msg: Message, state: FSMContext):
 # Кнопка "📚 Темы" — показывает список тем
 @user_router.message(F.text == "📚 Темы")
 async def show_topics(msg: Message, state: FSMContext):
+    quiz_timer.cancel(msg.from_user.id)
     await state.clear()  # сбрасываем состояние, если что-то зависло
     topics = await db.get_topics()
     if not topics:
@@ -53,20 +67,84 @@ async def show_topics(msg: Message, state: FSMContext):
 
 @user_router.message(F.text == "◀️ Назад")
 async def back_to_menu(msg: Message, state: FSMContext):
+    quiz_timer.cancel(msg.from_user.id)
     await state.clear()
     await msg.answer("Вы вернулись в меню.", reply_markup=user_panel_kb())
 
 @user_router.message(F.text == "📈 Моя статистика")
 async def show_stats(msg: Message):
     stats = await db.get_user_stats(msg.from_user.id)
-    if stats:
-        await msg.answer(
-            f"📊 Ваша статистика:\n\n"
-            f"🧪 Пройдено тестов: {stats['total_tests']}\n"
-            f"✅ Правильных ответов: {stats['correct_answers']}"
-        )
-    else:
+    if not stats:
         await msg.answer("Статистика пока отсутствует. Пройдите хотя бы один тест.")
+        return
+
+    text = (
+        f"📊 Ваша статистика:\n\n"
+        f"🧪 Пройдено тестов: {stats['total_tests']}\n"
+        f"✅ Правильных ответов: {stats['correct_answers']}"
+    )
+    user_id = msg.from_user.id
+    series = progress_series(await db.get_user_progress(user_id, CHART_DAYS))
+    if not series:
+        await msg.answer(text)
+        return
+    # График строится по журналу ответов, поэтому и кэшируется по его данным,
+    # а не по счётчикам user_stats, которые пишутся отдельно
+    key = series_key(series)
+
+    # График по этим данным уже отправлялся — повторяем по file_id
+    cached = charts.get(user_id, key)
+    if cached is not None and cached[1]:
+        await msg.answer_photo(cached[1], caption=text)
+        return
+
+    png = cached[0] if cached is not None else None
+    if png is None:
+        # Рисуется в отдельном процессе; при перегрузке отвечаем без графика
+        png = await charts.render(series)
+    if png is None:
+        await msg.answer(text)
+        return
+
+    charts.remember(user_id, key, png=png)
+    sent = await msg.answer_photo(BufferedInputFile(png, filename="progress.png"), caption=text)
+    charts.remember(user_id, key, file_id=sent.photo[-1].file_id)
+
+# Сколько строк показывать в рейтинге
+TOP_SIZE = 10
+
+# В рейтинге, который видят все, Telegram ID показываем не целиком
+def mask_id(telegram_id):
+    digits = str(telegram_id)
+    return f"{digits[:2]}***{digits[-2:]}"
+
+# Рейтинг: /top — общий, /top <тема> — по теме (и /top@ИмяБота <тема> в группах)
+@user_router.message(Command('top'))
+@user_router.message(F.text == "🏆 Рейтинг")
+async def show_top(msg: Message, command: CommandObject = None):
+    # У кнопки «🏆 Рейтинг» команды нет — общий рейтинг
+    args = command.args if command is not None else None
+    topic = args.strip() if args and args.strip() else None
+    # Рейтинг строится только для существующих тем (список тем берётся из кэша),
+    # иначе случайный текст занимал бы место настоящих тем в кэше рейтинга
+    if topic is not None and topic not in await db.get_topics():
+        await msg.answer(f"Нет такой темы: «{topic}».")
+        return
+
+    top = await leaderboard.top(TOP_SIZE, topic)
+    if not top:
+        await msg.answer("Рейтинг пока пуст. Пройдите хотя бы один тест.")
+        return
+
+    lines = ["🏆 Рейтинг:" if topic is None else f"🏆 Рейтинг по теме «{topic}»:", ""]
+    for place, (telegram_id, score) in enumerate(top, start=1):
+        you = " — это вы" if telegram_id == msg.from_user.id else ""
+        lines.append(f"{place}. ID {mask_id(telegram_id)} — {score} ✅{you}")
+
+    rank = await leaderboard.rank(msg.from_user.id, topic)
+    if rank is not None:
+        lines.append(f"\nВаше место: {rank[0]} ({rank[1]} ✅)")
+    await msg.answer("\n".join(lines))
 
 @user_router.message(F.text == "💰 Донат")
 async def donate_info(msg: Message):
@@ -82,76 +160,194 @@ async def donate_info(msg: Message):
 @user_router.message(TestQuiz.topic)
 async def handle_topic(msg: Message, state: FSMContext):
     topic = msg.text
-    questions = await db.get_questions_by_topic(topic)
+    topic_ids = await db.get_topic_question_ids(topic)
 
-    if not questions:
+    if not topic_ids:
         await msg.answer("Нет вопросов по этой теме.")
         await state.clear()
         return
 
-    await state.update_data(topic=topic, questions=questions, current=0, correct_count=0)
-    await send_next_question(msg, state)
-
-def get_answer_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="A", callback_data="answer_A"),
-            InlineKeyboardButton(text="B", callback_data="answer_B")
-        ],
-        [
-            InlineKeyboardButton(text="C", callback_data="answer_C"),
-            InlineKeyboardButton(text="D", callback_data="answer_D")
-        ]
-    ])
-
-async def send_next_question(msg: Message, state: FSMContext):
-    data = await state.get_data()
-    questions = data["questions"]
-    current = data["current"]
-
-    if current >= len(questions):
-        score = data["correct_count"]
-        total = len(questions)
-        user_id = msg.from_user.id if msg.from_user else msg.chat.id
-        await db.update_user_stats(user_id, score)
-        await msg.answer(f"✅ Тест завершен!\nВаш результат: {score}/{total}", reply_markup=user_panel_kb())
+    # В состоянии храним только id выбранных вопросов — тексты берутся из кэша
+    session = QuizSession.sample(topic, topic_ids, QUIZ_LENGTH, QUIZ_SHUFFLE_OPTIONS)
+    if QUIZ_TEST_TIME:
+        session.ends_at = time.time() + QUIZ_TEST_TIME
+    await state.set_data(session.to_state())
+    # Тексты выбранных вопросов подгружаем одним запросом
+    await db.get_questions_by_ids(session.ids)
+    await send_next_question(msg, state, session, msg.from_user.id)
+
+# Текст вопроса собирается один раз на вопрос и порядок вариантов
+# (Question неизменяем и хэшируем)
+@lru_cache(maxsize=4096)
+def render_question(q, order="ABCD"):
+    options = {"A": q.option_a, "B": q.option_b, "C": q.option_c, "D": q.option_d}
+    return (
+        f"❓ {q.question}\n\n"
+        f"A) {options[order[0]]}\n"
+        f"B) {options[order[1]]}\n"
+        f"C) {options[order[2]]}\n"
+        f"D) {options[order[3]]}"
+    )
+
+# Строка с ограничениями по времени для текста вопроса
+def time_note(session: QuizSession):
+    notes = []
+    if QUIZ_QUESTION_TIME:
+        notes.append(f"на ответ {QUIZ_QUESTION_TIME} сек")
+    time_left = session.time_left()
+    if time_left is not None:
+        notes.append(f"до конца теста {int(time_left) // 60}:{int(time_left) % 60:02d}")
+    return f"⏱ {', '.join(notes)}\n" if notes else ""
+
+# Срок текущего вопроса ставится в общий таймер; по нему on_quiz_timeout переходит дальше
+def schedule_timeout(user_id: int, chat_id: int, message_id: int, session: QuizSession, photo=False):
+    delays = []
+    if QUIZ_QUESTION_TIME:
+        delays.append(QUIZ_QUESTION_TIME)
+    time_left = session.time_left()
+    if time_left is not None:
+        delays.append(time_left)
+    if delays:
+        quiz_timer.schedule(user_id, min(delays), (chat_id, message_id, session.current, photo))
+
+# edit=True — msg это сообщение с прошлым вопросом, и новый вопрос выводится в нём же
+async def send_next_question(msg: Message, state: FSMContext, session: QuizSession, user_id: int, edit=False):
+    q = None
+    skipped = False
+    while not session.finished and not session.time_is_up:
+        q = await db.get_question_by_id(session.question_id)
+        if q is not None:
+            break
+        # Вопрос удалили во время теста — пропускаем его
+        session.current += 1
+        skipped = True
+
+    if session.finished or session.time_is_up:
+        quiz_timer.cancel(user_id)
+        score = session.correct
+        total = session.total
+        stats_buffer.add(user_id, tests=1, topic=session.topic)
+        if edit:
+            await msg.delete()
+        title = "⏰ Время вышло!" if not session.finished else "✅ Тест завершен!"
+        await msg.answer(f"{title}\nВаш результат: {score}/{total}", reply_markup=user_panel_kb())
         await state.clear()
         return
 
-    q = questions[current]
-    text = (
-        f"❓ {q['question']}\n\n"
-        f"A) {q['option_a']}\n"
-        f"B) {q['option_b']}\n"
-        f"C) {q['option_c']}\n"
-        f"D) {q['option_d']}"
-    )
-    await msg.answer(text, reply_markup=get_answer_keyboard())
-    await state.set_state(TestQuiz.in_progress)
+    if skipped:
+        await state.update_data(session.cursor_state())
 
-@user_router.callback_query(TestQuiz.in_progress)
-async def handle_inline_answer(callback: CallbackQuery, state: FSMContext):
-    user_ans = callback.data.split("_")[1]  # "A", "B", "C" или "D"
+    text = f"Вопрос {session.current + 1}/{session.total}\n" + time_note(session) + render_question(q, session.option_order)
+    markup = answer_kb(session.current)
+    # С картинкой вопрос уходит подписью к фото; слишком длинный или без файла — обычным текстом
+    photo = media_uploader.available(q) and len(text) <= CAPTION_LIMIT
+    if edit and bool(msg.photo) == photo:
+        if photo:
+            edited = await media_uploader.send(q, lambda media: msg.edit_media(
+                InputMediaPhoto(media=media, caption=text), reply_markup=markup
+            ))
+        else:
+            edited = await msg.edit_text(text, reply_markup=markup)
+        if edited is not None:
+            schedule_timeout(user_id, msg.chat.id, msg.message_id, session, photo)
+            return
 
-    data = await state.get_data()
-    current_q = data["questions"][data["current"]]
-    correct = current_q["correct_option"]
+    if edit:
+        # Текстовое сообщение нельзя превратить в фото и наоборот,
+        # а фото с неудавшейся картинкой — в текст: отправляем вопрос заново
+        await msg.delete()
+    sent = None
+    if photo and media_uploader.available(q):
+        sent = await media_uploader.send(q, lambda media: msg.answer_photo(media, caption=text, reply_markup=markup))
+    if sent is None:
+        # Картинку отправить не удалось — вопрос уходит текстом, чтобы тест не встал
+        photo = False
+        sent = await msg.answer(text, reply_markup=markup)
+    # Вопрос в новом сообщении — ответы принимаются только из него
+    session.message_id = sent.message_id
+    await state.update_data(message_id=sent.message_id)
+    if not edit:
+        await state.set_state(TestQuiz.in_progress)
+    schedule_timeout(user_id, msg.chat.id, sent.message_id, session, photo)
+
+# Переход к следующему вопросу после ответа или по истечении времени
+async def advance(msg: Message, state: FSMContext, session: QuizSession, user_id: int):
+    if QUIZ_EDIT_MESSAGE:
+        # Следующий вопрос в том же сообщении
+        await send_next_question(msg, state, session, user_id, edit=True)
+    else:
+        # Удалим сообщение с вопросом и отправим следующий
+        await msg.delete()
+        await send_next_question(msg, state, session, user_id)
+
+@user_router.callback_query(TestQuiz.in_progress, Answer.filter())
+async def handle_inline_answer(callback: CallbackQuery, callback_data: Answer, state: FSMContext):
+    user_ans = callback_data.o  # "A", "B", "C" или "D"
+
+    session = QuizSession.from_state(await state.get_data())
+    # Повторное нажатие, кнопка со старого вопроса или из сообщения прошлого теста
+    if (session.finished or callback_data.i != session.current
+            or callback.message is None or callback.message.message_id != session.message_id):
+        await callback.answer("Этот вопрос уже пройден.")
+        return
+    # Сразу отвечаем на callback, чтобы у пользователя не висели «часики»
+    await callback.answer()
+
+    # Ответ после окончания времени не засчитывается — сразу завершаем тест
+    if session.time_is_up:
+        await advance(callback.message, state, session, callback.from_user.id)
+        return
+
+    current_q = await db.get_question_by_id(session.question_id)
 
     correct_count = 0
-    if user_ans == correct:
-        data["correct_count"] += 1
-        correct_count = 1  # Засчитываем 1 правильный ответ
+    if current_q is not None:
+        chosen = session.original_option(user_ans)
+        if chosen == current_q.correct_option:
+            session.correct += 1
+            correct_count = 1  # Засчитываем 1 правильный ответ
+        # В журнал ответов — через буфер, без запроса к базе
+        answer_log.add(callback.from_user.id, current_q.id, session.topic, chosen, bool(correct_count))
+
+    session.current += 1
+    # Пишем только курсор и счёт, а не весь список вопросов
+    await state.update_data(session.cursor_state())
 
-    data["current"] += 1
-    await state.update_data(**data)
+    # ✅ Копим статистику в буфере — в базу она уйдёт пачкой
+    stats_buffer.add(callback.from_user.id, correct=correct_count, topic=session.topic)
 
-    # ✅ Обновляем статистику в БД сразу после ответа
-    await db.update_user_stats(callback.from_user.id, correct_count)
+    await advance(callback.message, state, session, callback.from_user.id)
 
-    # Удалим сообщение с вопросом
-    await callback.message.delete()
+# Истёк срок вопроса или теста (вызывается общим таймером quiz_timer).
+# Вопрос без ответа не засчитывается; по истечении времени теста он завершается
+# с записью результата, а сессия удаляется из хранилища.
+async def on_quiz_timeout(bot: Bot, storage: BaseStorage, user_id: int, payload):
+    chat_id, message_id, index, photo = payload
+    state = FSMContext(storage=storage, key=StorageKey(bot_id=bot.id, chat_id=chat_id, user_id=user_id))
+    # Та же блокировка, что и у обновлений пользователя: таймер не должен пересечься с ответом
+    async with user_locks(user_id):
+        if await state.get_state() != TestQuiz.in_progress.state:
+            return
+        session = QuizSession.from_state(await state.get_data())
+        # Пользователь уже ответил и перешёл к другому вопросу (или начал другой тест)
+        if session.current != index or session.message_id != message_id:
+            return
 
-    # Следующий вопрос
-    await send_next_question(callback.message, state)
+        if not session.time_is_up:
+            session.current += 1
+            await state.update_data(session.cursor_state())
 
+        # Сообщение с вопросом восстанавливаем по id, чтобы переиспользовать обычный переход
+        # (photo — только признак фото, чтобы выбрать между edit_text и edit_media)
+        msg = Message.model_validate({
+            "message_id": message_id,
+            "date": datetime.now(),
+            "chat": {"id": chat_id, "type": "private"},
+            "photo": [{"file_id": "", "file_unique_id": "", "width": 0, "height": 0}] if photo else None,
+        }, context={"bot": bot})
+        await advance(msg, state, session, user_id)
 
+# Нажатие на кнопку ответа после завершения теста
+@user_router.callback_query(Answer.filter())
+async def handle_stale_answer(callback: CallbackQuery):
+    await callback.answer("Тест уже завершен.")
@@ -0,0 +1,172 @@
+# importer.py
+import asyncio
+import csv
+import json
+import os
+
+# Поддерживаемые форматы файла с вопросами
+IMPORT_EXTENSIONS = (".csv", ".json", ".jsonl", ".xlsx")
+# Сколько строк файла разбирать за один заход в отдельном потоке
+IMPORT_CHUNK_SIZE = 1000
+# По сколько символов читать JSON-массив
+JSON_BLOCK_SIZE = 64 * 1024
+
+# Колонки файла и их допустимые названия
+COLUMNS = {
+    "topic": ("topic", "тема"),
+    "question": ("question", "вопрос"),
+    "option_a": ("option_a", "a"),
+    "option_b": ("option_b", "b"),
+    "option_c": ("option_c", "c"),
+    "option_d": ("option_d", "d"),
+    "correct_option": ("correct_option", "correct", "ответ"),
+}
+
+# Необязательная колонка: путь к картинке относительно MEDIA_DIR
+MEDIA_COLUMNS = ("image", "media", "картинка")
+
+
+def _iter_csv(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        # Разделитель определяем по первой строке: Excel часто сохраняет CSV через ";"
+        first_line = f.readline()
+        f.seek(0)
+        delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+        yield from csv.DictReader(f, delimiter=delimiter)
+
+
+def _iter_json(path):
+    with open(path, encoding="utf-8-sig") as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from _iter_json_array(f)
+        else:
+            # JSON Lines читаем построчно
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+# JSON-массив читается блоками, и элементы разбираются по одному,
+# поэтому в памяти держится только текущий блок, а не весь массив
+def _iter_json_array(f):
+    decoder = json.JSONDecoder()
+    buffer = f.read(JSON_BLOCK_SIZE).lstrip()[1:]  # без "["
+    eof = False
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,")
+        if buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Элемент не поместился в прочитанное — дочитываем (или файл битый)
+                if eof:
+                    raise
+            else:
+                yield item
+                buffer = buffer[end:]
+                continue
+        elif eof:
+            raise ValueError("JSON-массив не закрыт")
+        block = f.read(JSON_BLOCK_SIZE)
+        eof = not block
+        buffer += block
+
+
+def _iter_xlsx(path):
+    from openpyxl import load_workbook
+
+    # read_only — строки читаются потоком, без загрузки всего листа
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(cell or "") for cell in header]
+        for row in rows:
+            yield dict(zip(header, row))
+    finally:
+        workbook.close()
+
+
+def iter_rows(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return _iter_csv(path)
+    if extension in (".json", ".jsonl"):
+        return _iter_json(path)
+    if extension == ".xlsx":
+        return _iter_xlsx(path)
+    raise ValueError(f"Неподдерживаемый формат файла: {extension}")
+
+
+# Строка файла -> запись для таблицы questions, либо None, если строка некорректна
+def validate_row(row):
+    if not isinstance(row, dict):
+        return None
+    normalized = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+
+    record = []
+    for column, names in COLUMNS.items():
+        value = next((normalized[name] for name in names if normalized.get(name) not in (None, "")), None)
+        if value is None:
+            return None
+        value = str(value).strip()
+        if not value:
+            return None
+        record.append(value)
+
+    correct = record[-1].upper()
+    if correct not in ("A", "B", "C", "D"):
+        return None
+    record[-1] = correct
+    media = next((normalized[name] for name in MEDIA_COLUMNS if normalized.get(name) not in (None, "")), "")
+    media = str(media).strip()
+    if media:
+        # Путь только внутри MEDIA_DIR: абсолютные пути и выход через ".." не принимаем
+        media = os.path.normpath(media.replace("\\", "/"))
+        if os.path.isabs(media) or media == ".." or media.startswith("../"):
+            return None
+    record.append(media or None)
+    return tuple(record)
+
+
+# Потоковый разбор файла: строки читаются и проверяются пачками в отдельном потоке,
+# а records() отдаёт валидные записи по одной (их можно передать прямо в COPY).
+# В памяти держится одна пачка, сколько бы строк ни было в файле.
+class ImportReader:
+    def __init__(self, path, chunk_size=IMPORT_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.rows = None
+        self.valid = 0
+        self.invalid = 0
+
+    def _read_chunk(self):
+        if self.rows is None:
+            self.rows = iter_rows(self.path)
+        records = []
+        for row in self.rows:
+            record = validate_row(row)
+            if record is None:
+                self.invalid += 1
+                continue
+            records.append(record)
+            if len(records) >= self.chunk_size:
+                break
+        self.valid += len(records)
+        return records
+
+    async def records(self):
+        while True:
+            records = await asyncio.to_thread(self._read_chunk)
+            if not records:
+                return
+            for record in records:
+                yield record
@@ -1,14 +1,92 @@
+from functools import lru_cache
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters.callback_data import CallbackData
+
+# Кнопки листания списка вопросов: d — направление ("next"/"prev"), c — id-курсор
+class QuestionsPage(CallbackData, prefix="qp"):
+    d: str
+    c: int
+
+# Ответ на вопрос теста: i — номер вопроса (повторные и устаревшие нажатия отбрасываются), o — вариант
+class Answer(CallbackData, prefix="ans"):
+    i: int
+    o: str
+
+# Действия с вопросом из поиска: a — действие ("del", "del_ok", "edit", "field", "cancel"),
+# id — id вопроса, f — изменяемое поле
+class QuestionAction(CallbackData, prefix="qa"):
+    a: str
+    id: int
+    f: str = ""
+
+# Названия полей вопроса для кнопок редактирования
+EDIT_FIELDS = {
+    "question": "Вопрос",
+    "option_a": "A",
+    "option_b": "B",
+    "option_c": "C",
+    "option_d": "D",
+    "correct_option": "Ответ",
+    "topic": "Тема",
+}
 
 def admin_panel_kb():
     return ReplyKeyboardMarkup(keyboard=[
         [KeyboardButton(text="📥 Добавить вопрос")],
-        [KeyboardButton(text="📄 Посмотреть все вопросы")]
+        [KeyboardButton(text="📄 Посмотреть все вопросы")],
+        [KeyboardButton(text="📤 Импорт вопросов")]
     ], resize_keyboard=True)
 
 def user_panel_kb():
     return ReplyKeyboardMarkup(keyboard=[
         [KeyboardButton(text="🧠 Пройти тест")],
         [KeyboardButton(text="📚 Темы"), KeyboardButton(text="📈 Моя статистика")],
-        [KeyboardButton(text="💰 Донат")]
+        [KeyboardButton(text="🏆 Рейтинг"), KeyboardButton(text="💰 Донат")]
     ], resize_keyboard=True)
+
+def questions_page_kb(first_id, last_id, has_prev, has_next):
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=QuestionsPage(d="prev", c=first_id).pack()))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=QuestionsPage(d="next", c=last_id).pack()))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+# Клавиатура ответов зависит только от номера вопроса — строим один раз и переиспользуем
+@lru_cache(maxsize=512)
+def answer_kb(index):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="A", callback_data=Answer(i=index, o="A").pack()),
+            InlineKeyboardButton(text="B", callback_data=Answer(i=index, o="B").pack())
+        ],
+        [
+            InlineKeyboardButton(text="C", callback_data=Answer(i=index, o="C").pack()),
+            InlineKeyboardButton(text="D", callback_data=Answer(i=index, o="D").pack())
+        ]
+    ])
+
+def search_results_kb(rows):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text=f"🗑 #{row['id']}", callback_data=QuestionAction(a="del", id=row['id']).pack()),
+            InlineKeyboardButton(text=f"✏️ #{row['id']}", callback_data=QuestionAction(a="edit", id=row['id']).pack())
+        ]
+        for row in rows
+    ])
+
+def confirm_delete_kb(question_id):
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Удалить", callback_data=QuestionAction(a="del_ok", id=question_id).pack()),
+        InlineKeyboardButton(text="❌ Отмена", callback_data=QuestionAction(a="cancel", id=question_id).pack())
+    ]])
+
+def edit_fields_kb(question_id):
+    buttons = [
+        InlineKeyboardButton(text=title, callback_data=QuestionAction(a="field", id=question_id, f=field).pack())
+        for field, title in EDIT_FIELDS.items()
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[:1], buttons[1:5], buttons[5:]])
@@ -0,0 +1,123 @@
+# leaderboard.py
+import asyncio
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from config import LEADERBOARD_SIZE, LEADERBOARD_REFRESH, LEADERBOARD_TOPICS
+from database import db
+
+
+# Топ-K пользователей по числу правильных ответов: отсортированный список
+# (-результат, telegram_id) и словарь результатов участников топа.
+# Результаты только растут, поэтому топ можно поддерживать по приращениям.
+class TopK:
+    def __init__(self, k):
+        self.k = k
+        self.entries = []
+        self.scores = {}
+
+    def update(self, telegram_id, score):
+        old = self.scores.get(telegram_id)
+        if old is not None:
+            if old == score:
+                return
+            del self.entries[bisect_left(self.entries, (-old, telegram_id))]
+            del self.scores[telegram_id]
+
+        entry = (-score, telegram_id)
+        if len(self.entries) < self.k or entry < self.entries[-1]:
+            insort(self.entries, entry)
+            self.scores[telegram_id] = score
+            if len(self.entries) > self.k:
+                _, dropped = self.entries.pop()
+                del self.scores[dropped]
+
+    def top(self, n):
+        return [(telegram_id, -score) for score, telegram_id in self.entries[:n]]
+
+    # Место в топе (одинаковый результат — одинаковое место) или None, если пользователь не в топе
+    def rank(self, telegram_id):
+        score = self.scores.get(telegram_id)
+        if score is None:
+            return None
+        return bisect_left(self.entries, (-score, 0)) + 1, score
+
+
+# Рейтинги: общий загружается при старте, по темам — при первом запросе.
+# Обновляются после каждой записи статистики и периодически перечитываются
+# из базы, чтобы учесть результаты, записанные другими процессами бота.
+class Leaderboard:
+    def __init__(self, database, k=LEADERBOARD_SIZE, max_topics=LEADERBOARD_TOPICS):
+        self.db = database
+        self.k = k
+        self.max_topics = max_topics
+        self.overall = TopK(k)
+        self.topics = OrderedDict()  # тема -> TopK
+        self._task = None
+
+    async def load(self):
+        board = TopK(self.k)
+        for row in await self.db.get_top_users(self.k):
+            board.update(row['telegram_id'], row['correct_answers'])
+        self.overall = board
+        self.topics.clear()
+
+    async def _topic_board(self, topic):
+        board = self.topics.get(topic)
+        if board is None:
+            board = TopK(self.k)
+            for row in await self.db.get_top_users(self.k, topic):
+                board.update(row['telegram_id'], row['correct_answers'])
+            self.topics[topic] = board
+            while len(self.topics) > self.max_topics:
+                self.topics.popitem(last=False)
+        else:
+            self.topics.move_to_end(topic)
+        return board
+
+    # Подписчик Database.stats_listeners: итоговые значения после фиксации пакета
+    def on_stats(self, totals, topic_totals):
+        for row in totals:
+            self.overall.update(row['telegram_id'], row['correct_answers'])
+        for row in topic_totals:
+            board = self.topics.get(row['topic'])
+            # Незагруженные темы прочитаются из базы уже с этими данными
+            if board is not None:
+                board.update(row['telegram_id'], row['correct_answers'])
+
+    async def top(self, n, topic=None):
+        board = self.overall if topic is None else await self._topic_board(topic)
+        return board.top(n)
+
+    # (место, результат) пользователя; вне топа — подсчёт по индексу
+    async def rank(self, telegram_id, topic=None):
+        board = self.overall if topic is None else await self._topic_board(topic)
+        result = board.rank(telegram_id)
+        if result is not None:
+            return result
+        row = await self.db.get_user_rank(telegram_id, topic)
+        if row is None:
+            return None
+        return row['rank'], row['correct_answers']
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(LEADERBOARD_REFRESH)
+            try:
+                await self.load()
+            except Exception as e:
+                print(f"❌ Ошибка обновления рейтинга: {e}")
+
+    async def start(self):
+        await self.load()
+        self.db.stats_listeners.append(self.on_stats)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# Глобальный рейтинг
+leaderboard = Leaderboard(db)
@@ -0,0 +1,54 @@
+# locks.py
+import asyncio
+
+
+# Набор asyncio-блокировок по ключу. Блокировка живёт, пока её кто-то держит
+# или ждёт, поэтому память зависит только от числа активных ключей.
+class KeyedLock:
+    def __init__(self):
+        self._locks = {}  # key -> [lock, число держащих и ожидающих]
+
+    def __call__(self, key):
+        return _KeyedLockContext(self, key)
+
+    def __len__(self):
+        return len(self._locks)
+
+    async def acquire(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_ref(key, entry)
+            raise
+
+    def release(self, key):
+        entry = self._locks[key]
+        entry[0].release()
+        self._release_ref(key, entry)
+
+    def locked(self, key):
+        entry = self._locks.get(key)
+        return entry is not None and entry[0].locked()
+
+    def _release_ref(self, key, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+
+class _KeyedLockContext:
+    __slots__ = ("keyed_lock", "key")
+
+    def __init__(self, keyed_lock, key):
+        self.keyed_lock = keyed_lock
+        self.key = key
+
+    async def __aenter__(self):
+        await self.keyed_lock.acquire(self.key)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.keyed_lock.release(self.key)
@@ -0,0 +1,105 @@
+# media.py
+import asyncio
+import os
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+from config import MEDIA_DIR, MEDIA_UPLOAD_CONCURRENCY
+from database import db
+
+# Предельная длина подписи к фото в Telegram
+CAPTION_LIMIT = 1024
+
+
+# Отправка картинок к вопросам. Если у вопроса уже есть file_id, файл не загружается.
+# Локальный файл загружается при первой отправке (не больше concurrency загрузок
+# одновременно), полученный file_id сохраняется в базе и дальше используется он.
+# Параллельные отправки того же вопроса ждут идущую загрузку, а не грузят файл повторно.
+# Картинку, которую Telegram не принял (битый файл, не изображение), больше не пробуем
+# до перезапуска — такой вопрос отправляется текстом.
+class MediaUploader:
+    def __init__(self, database, concurrency=MEDIA_UPLOAD_CONCURRENCY, media_dir=MEDIA_DIR):
+        self.db = database
+        self.media_dir = os.path.realpath(media_dir)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._uploading = {}  # id вопроса -> future с file_id (None, если загрузка не удалась)
+        self.failed = set()  # id вопросов, картинки которых не удалось отправить
+        self.uploads = 0
+        self.errors = 0
+
+    # Полный путь к локальному файлу или None, если путь ведёт за пределы MEDIA_DIR
+    def _local_path(self, question):
+        if not question.media_path:
+            return None
+        path = os.path.realpath(os.path.join(self.media_dir, question.media_path))
+        if os.path.commonpath([path, self.media_dir]) != self.media_dir:
+            return None
+        return path
+
+    # Есть ли что отправить: file_id или существующий локальный файл внутри MEDIA_DIR
+    def available(self, question):
+        if question.id in self.failed:
+            return False
+        if question.media_file_id:
+            return True
+        path = self._local_path(question)
+        return path is not None and os.path.isfile(path)
+
+    # send(media) отправляет сообщение с картинкой (file_id или файл) и возвращает его.
+    # Если отправить картинку не удалось, возвращает None — вызывающий отправляет вопрос текстом.
+    async def send(self, question, send):
+        try:
+            return await self._send(question, send)
+        except Exception as e:
+            self.errors += 1
+            # Ошибку сети можно повторить, а файл, который Telegram отверг, — нет
+            if isinstance(e, (TelegramBadRequest, OSError)):
+                self.failed.add(question.id)
+            print(f"❌ Не удалось отправить картинку вопроса {question.id}: {e}")
+            return None
+
+    async def _send(self, question, send):
+        if question.media_file_id:
+            return await send(question.media_file_id)
+
+        future = self._uploading.get(question.id)
+        if future is not None:
+            file_id = await asyncio.shield(future)
+            if file_id:
+                return await send(file_id)
+            if question.id in self.failed:
+                return None
+
+        path = self._local_path(question)
+        if path is None:
+            raise OSError(f"путь {question.media_path!r} вне каталога картинок")
+
+        future = asyncio.get_running_loop().create_future()
+        self._uploading[question.id] = future
+        file_id = None
+        try:
+            async with self._semaphore:
+                sent = await send(FSInputFile(path))
+            file_id = sent.photo[-1].file_id
+            self.uploads += 1
+        finally:
+            del self._uploading[question.id]
+            future.set_result(file_id)
+
+        try:
+            await self.db.set_question_file_id(question.id, file_id)
+        except Exception as e:
+            # Сообщение уже отправлено; file_id сохраним при следующей загрузке
+            print(f"❌ Не удалось сохранить file_id картинки вопроса {question.id}: {e}")
+        return sent
+
+    def stats(self):
+        return {
+            "uploading": len(self._uploading),
+            "uploads": self.uploads,
+            "errors": self.errors,
+            "failed": len(self.failed),
+        }
+
+
+# Глобальный загрузчик картинок
+media_uploader = MediaUploader(db)
@@ -0,0 +1,241 @@
+# metrics.py
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict
+from aiohttp import web
+from asyncpg import Record
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from config import SLOW_QUERY_MS
+
+# Границы корзин гистограмм задержек, в секундах
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # значения меток -> [счётчики корзин..., сумма, количество]
+
+    def observe(self, value, *label_values):
+        row = self.values.get(label_values)
+        if row is None:
+            row = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, row in self.values.items():
+            names = self.labels + ("le",)
+            for bound, count in zip(self.buckets, row):
+                lines.append(f"{self.name}_bucket{_labels(names, label_values + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(names, label_values + ('+Inf',))} {row[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {row[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {row[-1]}")
+        return lines
+
+
+UPDATE_LATENCY = Histogram("bot_update_seconds", "Update processing time", ("event",))
+UPDATE_ERRORS = Counter("bot_update_errors_total", "Updates failed with an exception", ("event",))
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Handler execution time", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handler exceptions", ("handler",))
+DB_LATENCY = Histogram("db_query_seconds", "Database method time", ("method",))
+DB_ROWS = Counter("db_query_rows_total", "Rows returned or affected by database methods", ("method",))
+DB_ERRORS = Counter("db_query_errors_total", "Database method exceptions", ("method",))
+DB_ACQUIRE_WAIT = Histogram("db_pool_acquire_seconds", "Time waiting for a pool connection")
+DB_CACHE_HITS = Counter("db_cache_hits_total", "Database method calls served from memory", ("method",))
+
+METRICS = [
+    UPDATE_LATENCY, UPDATE_ERRORS, HANDLER_LATENCY, HANDLER_ERRORS,
+    DB_LATENCY, DB_ROWS, DB_ERRORS, DB_ACQUIRE_WAIT, DB_CACHE_HITS,
+]
+
+# Замер текущего вызова метода Database: [брал ли соединение из пула] или None вне замера
+_db_call = ContextVar("db_call", default=None)
+
+# Источники мгновенных значений (размер пула, буферы, кэш): имя -> функция, возвращающая dict
+GAUGES = {}
+
+
+def register_gauges(prefix, source):
+    GAUGES[prefix] = source
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for prefix, source in GAUGES.items():
+        for name, value in source().items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Внешний middleware на dp.update: время и ошибки обработки обновления по типу события
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        event_type = getattr(event, "event_type", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.inc(event_type)
+            raise
+        finally:
+            UPDATE_LATENCY.observe(time.perf_counter() - start, event_type)
+
+
+# Внутренний middleware (message, callback_query): время и ошибки по конкретному хендлеру
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+
+
+def _row_count(result):
+    if isinstance(result, Record):
+        return 1
+    if isinstance(result, (list, dict)):
+        return len(result)
+    if isinstance(result, tuple):
+        # (строки, есть ли ещё) или (итоги, итоги по темам) — считаем строки в списках
+        lists = [item for item in result if isinstance(item, list)]
+        return sum(len(item) for item in lists) if lists else len(result)
+    # Число изменённых строк (delete_question, import_questions, ...)
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    # Статус команды, например "DELETE 3"
+    if isinstance(result, str) and result.rsplit(" ", 1)[-1].isdigit():
+        return int(result.rsplit(" ", 1)[-1])
+    return 0
+
+
+# Обёртка метода Database: время, число строк, ошибки и журнал медленных запросов.
+# Время пишется, только если метод брал соединение из пула; ответ из кэша в памяти
+# считается в db_cache_hits_total. Вложенные вызовы (get_question_by_id ->
+# get_questions_by_ids) замеряет только внешний метод.
+def observe_query(method):
+    name = method.__name__
+
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        if _db_call.get() is not None:
+            return await method(*args, **kwargs)
+        call = [False]
+        token = _db_call.set(call)
+        start = time.perf_counter()
+        try:
+            result = await method(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(name)
+            raise
+        finally:
+            _db_call.reset(token)
+            elapsed = time.perf_counter() - start
+            if call[0]:
+                DB_LATENCY.observe(elapsed, name)
+                if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+                    print(f"🐢 Медленный запрос {name}: {elapsed * 1000:.0f} мс")
+        if call[0]:
+            DB_ROWS.inc(name, amount=_row_count(result))
+        else:
+            DB_CACHE_HITS.inc(name)
+        return result
+
+    return wrapper
+
+
+# Пул asyncpg с замером ожидания свободного соединения
+class TimedPool:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def acquire(self):
+        return _TimedAcquire(self._pool)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class _TimedAcquire:
+    __slots__ = ("pool", "conn")
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        self.conn = await self.pool.acquire()
+        DB_ACQUIRE_WAIT.observe(time.perf_counter() - start)
+        call = _db_call.get()
+        if call is not None:
+            call[0] = True
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.pool.release(self.conn)
+
+
+async def metrics_handler(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+# Отдельный HTTP-сервер для /metrics (слушает локальный адрес)
+async def start_metrics_server(host, port):
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,24 @@
+-- Исходная схема (для существующих установок ничего не меняет)
+CREATE TABLE IF NOT EXISTS admins (
+    id SERIAL PRIMARY KEY,
+    telegram_id BIGINT UNIQUE,
+    username TEXT
+);
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    id SERIAL PRIMARY KEY,
+    telegram_id BIGINT,
+    total_tests INT DEFAULT 0,
+    correct_answers INT DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS questions (
+    id SERIAL PRIMARY KEY,
+    topic TEXT,
+    question TEXT,
+    option_a TEXT,
+    option_b TEXT,
+    option_c TEXT,
+    option_d TEXT,
+    correct_option TEXT
+);
@@ -0,0 +1,18 @@
+-- Склеиваем дубликаты статистики и запрещаем новые:
+-- одна строка на пользователя, поиск по telegram_id через индекс
+UPDATE user_stats u
+SET total_tests = agg.total_tests,
+    correct_answers = agg.correct_answers
+FROM (
+    SELECT min(id) AS id, sum(total_tests) AS total_tests, sum(correct_answers) AS correct_answers
+    FROM user_stats
+    GROUP BY telegram_id
+    HAVING count(*) > 1
+) agg
+WHERE u.id = agg.id;
+
+DELETE FROM user_stats u
+USING user_stats d
+WHERE u.telegram_id = d.telegram_id AND u.id > d.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS user_stats_telegram_id_key ON user_stats (telegram_id);
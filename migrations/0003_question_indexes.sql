@@ -0,0 +1,9 @@
+-- no-transaction
+-- Индексы строятся без блокировки записи в таблицу вопросов.
+-- Недостроенный после сбоя индекс остаётся INVALID, поэтому сначала удаляем его.
+DROP INDEX CONCURRENTLY IF EXISTS questions_topic_idx;
+CREATE INDEX CONCURRENTLY questions_topic_idx ON questions (topic, id);
+
+-- hash-индекс: удаление по точному тексту, без ограничения на длину строки как у btree
+DROP INDEX CONCURRENTLY IF EXISTS questions_question_idx;
+CREATE INDEX CONCURRENTLY questions_question_idx ON questions USING hash (question);
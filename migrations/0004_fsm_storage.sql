@@ -0,0 +1,10 @@
+-- Состояния FSM (сессии тестов и добавления вопросов), общие для всех процессов бота
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Для очистки брошенных сессий по времени
+CREATE INDEX IF NOT EXISTS fsm_storage_updated_at_idx ON fsm_storage (updated_at);
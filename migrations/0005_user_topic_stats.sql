@@ -0,0 +1,11 @@
+-- Статистика пользователя по темам (для рейтингов по темам)
+CREATE TABLE IF NOT EXISTS user_topic_stats (
+    telegram_id BIGINT NOT NULL,
+    topic TEXT NOT NULL,
+    total_tests INT NOT NULL DEFAULT 0,
+    correct_answers INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (telegram_id, topic)
+);
+
+-- Топ темы и место пользователя в теме
+CREATE INDEX IF NOT EXISTS user_topic_stats_rank_idx ON user_topic_stats (topic, correct_answers DESC);
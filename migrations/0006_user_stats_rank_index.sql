@@ -0,0 +1,4 @@
+-- no-transaction
+-- Общий топ и подсчёт места пользователя без полного просмотра user_stats
+DROP INDEX CONCURRENTLY IF EXISTS user_stats_rank_idx;
+CREATE INDEX CONCURRENTLY user_stats_rank_idx ON user_stats (correct_answers DESC);
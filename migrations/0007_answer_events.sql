@@ -0,0 +1,22 @@
+-- Журнал ответов: только добавление, секции по месяцам создаются при записи
+CREATE TABLE IF NOT EXISTS answer_events (
+    created_at TIMESTAMPTZ NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    question_id INT NOT NULL,
+    topic TEXT,
+    chosen CHAR(1) NOT NULL,
+    is_correct BOOLEAN NOT NULL
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX IF NOT EXISTS answer_events_user_idx ON answer_events (telegram_id, created_at);
+
+-- Накопительные счётчики по вопросам: обновляются пачкой вместе с записью журнала
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id INT PRIMARY KEY,
+    attempts INT NOT NULL DEFAULT 0,
+    correct INT NOT NULL DEFAULT 0,
+    chosen_a INT NOT NULL DEFAULT 0,
+    chosen_b INT NOT NULL DEFAULT 0,
+    chosen_c INT NOT NULL DEFAULT 0,
+    chosen_d INT NOT NULL DEFAULT 0
+);
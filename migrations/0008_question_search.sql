@@ -0,0 +1,6 @@
+-- no-transaction
+-- Триграммный индекс для поиска вопросов по фрагменту текста (/search)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DROP INDEX CONCURRENTLY IF EXISTS questions_question_trgm_idx;
+CREATE INDEX CONCURRENTLY questions_question_trgm_idx ON questions USING gin (question gin_trgm_ops);
@@ -0,0 +1,4 @@
+-- Картинка к вопросу: file_id уже загруженного в Telegram файла
+-- или путь к локальному файлу (загружается при первой отправке, затем сохраняется file_id)
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS media_file_id TEXT;
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS media_path TEXT;
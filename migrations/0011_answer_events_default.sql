@@ -0,0 +1,3 @@
+-- Запасная секция журнала ответов: сюда попадают строки, для которых нет месячной секции,
+-- вместо ошибки всей пачки COPY
+CREATE TABLE IF NOT EXISTS answer_events_default PARTITION OF answer_events DEFAULT;
@@ -0,0 +1,98 @@
+# quiz.py
+import random
+import time
+from array import array
+
+OPTIONS = "ABCD"
+
+
+# Состояние прохождения теста: только id вопросов, курсор и счёт.
+# Тексты вопросов берутся из общего кэша базы, поэтому при ответе
+# в FSM пишутся лишь курсор и счёт — объём не зависит от размера темы.
+# order — порядок вариантов для каждого вопроса по 4 буквы подряд
+# ("CADB": на месте A показан вариант C и т.д.); пустая строка — без перемешивания.
+# ends_at — время окончания теста (unix time), 0 — без ограничения.
+# message_id — сообщение с текущим вопросом: нажатия в других сообщениях
+# (например, оставшихся от прошлого теста) не принимаются.
+class QuizSession:
+    __slots__ = ("topic", "ids", "current", "correct", "order", "ends_at", "message_id")
+
+    def __init__(self, topic, ids, current=0, correct=0, order="", ends_at=0, message_id=0):
+        self.topic = topic
+        self.ids = ids if isinstance(ids, array) else array("l", ids)
+        self.current = current
+        self.correct = correct
+        self.order = order
+        self.ends_at = ends_at
+        self.message_id = message_id
+
+    # Новый тест: length случайных вопросов темы без повторов (0 — все вопросы).
+    # random.sample по кортежу работает за O(length), а не за O(размер темы).
+    @classmethod
+    def sample(cls, topic, topic_ids, length=0, shuffle_options=False):
+        if 0 < length < len(topic_ids):
+            ids = random.sample(topic_ids, length)
+        else:
+            ids = list(topic_ids)
+            random.shuffle(ids)
+        order = ""
+        if shuffle_options:
+            order = "".join("".join(random.sample(OPTIONS, 4)) for _ in ids)
+        return cls(topic, ids, order=order)
+
+    @classmethod
+    def from_state(cls, data):
+        return cls(
+            data["topic"], data["ids"], data["current"], data["correct_count"],
+            data.get("order", ""), data.get("ends_at", 0), data.get("message_id", 0),
+        )
+
+    # Полное состояние — записывается один раз при старте теста
+    def to_state(self):
+        return {
+            "topic": self.topic,
+            "ids": self.ids.tolist(),
+            "current": self.current,
+            "correct_count": self.correct,
+            "order": self.order,
+            "ends_at": self.ends_at,
+            "message_id": self.message_id,
+        }
+
+    # Изменяемая часть — записывается после каждого ответа
+    def cursor_state(self):
+        return {"current": self.current, "correct_count": self.correct}
+
+    @property
+    def total(self):
+        return len(self.ids)
+
+    @property
+    def finished(self):
+        return self.current >= len(self.ids)
+
+    # Время на тест истекло
+    @property
+    def time_is_up(self):
+        return bool(self.ends_at) and time.time() >= self.ends_at
+
+    # Секунд до конца теста (None — без ограничения)
+    def time_left(self):
+        if not self.ends_at:
+            return None
+        return max(0, self.ends_at - time.time())
+
+    @property
+    def question_id(self):
+        return self.ids[self.current]
+
+    # Порядок вариантов текущего вопроса
+    @property
+    def option_order(self):
+        if not self.order:
+            return OPTIONS
+        return self.order[self.current * 4:self.current * 4 + 4]
+
+    # Показанная буква -> буква варианта в базе
+    def original_option(self, letter):
+        return self.option_order[OPTIONS.index(letter)]
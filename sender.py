@@ -0,0 +1,205 @@
+# sender.py
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from config import (
+    SEND_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES, BROADCAST_CONCURRENCY,
+)
+from database import db
+
+# Приоритеты исходящих запросов: меньше — раньше
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Приоритет запросов текущей задачи (рассылка выставляет PRIORITY_BULK)
+send_priority = ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+# Сколько чатов помнить для ограничения по чату
+MAX_CHAT_BUCKETS = 10000
+BROADCAST_PAGE_SIZE = 1000
+
+
+# Ведро токенов: reserve() забирает токен (баланс может уйти в минус)
+# и возвращает, сколько секунд нужно подождать до его появления
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        self._refill()
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_consume(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    # Запрет запросов на seconds секунд (ответ 429 от Telegram)
+    def pause(self, seconds):
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+# Планировщик исходящих запросов, подключается к сессии бота как middleware,
+# поэтому через него идут все вызовы API. Запросы к чатам ограничиваются
+# общим ведром (~30 в секунду) и ведром на чат; токены общего ведра выдаются
+# по приоритету, так что рассылка не задерживает ответы пользователям.
+# На 429 притормаживается только ведро этого чата, и запрос повторяется после retry_after.
+class OutboundScheduler(BaseRequestMiddleware):
+    def __init__(self, rate=SEND_RATE, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                 max_retries=SEND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(rate, rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.chat_buckets = OrderedDict()
+        self.waiters = []  # куча (приоритет, номер, future)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            while len(self.chat_buckets) > MAX_CHAT_BUCKETS:
+                self.chat_buckets.popitem(last=False)
+        else:
+            self.chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire(self, chat_id, priority):
+        delay = self._chat_bucket(chat_id).reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        # Без очереди, если токен есть и никто не ждёт
+        if not self.waiters and self.global_bucket.try_consume():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._seq), future))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        await future
+
+    # Выдача токенов ожидающим по приоритету
+    async def _run(self):
+        while True:
+            if not self.waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self.global_bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            while self.waiters:
+                _, _, future = heapq.heappop(self.waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                self.global_bucket.refund()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        # getUpdates, answerCallbackQuery и т.п. не ограничиваем
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+                # Telegram просит подождать — притормаживаем только этот чат;
+                # повтор дождётся токена его ведра в _acquire, остальные чаты не ждут
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                continue
+            self.sent += 1
+            return response
+
+    def stats(self):
+        return {
+            "queued": len(self.waiters),
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+
+# Глобальный планировщик; подключается в bot.py через bot.session.middleware
+outbound = OutboundScheduler()
+
+
+# Рассылка всем пользователям из user_stats с низким приоритетом.
+# Пользователи читаются страницами, одновременно отправляется не больше concurrency сообщений.
+async def broadcast(bot: Bot, text: str, concurrency=BROADCAST_CONCURRENCY):
+    send_priority.set(PRIORITY_BULK)
+    semaphore = asyncio.Semaphore(concurrency)
+    sent = 0
+    failed = 0
+
+    async def send(telegram_id):
+        nonlocal sent, failed
+        try:
+            await bot.send_message(telegram_id, text)
+            sent += 1
+        except TelegramAPIError:
+            # Пользователь заблокировал бота или удалил чат
+            failed += 1
+        finally:
+            semaphore.release()
+
+    tasks = set()
+    after_id = 0
+    while True:
+        user_ids = await db.get_user_ids_page(after_id, BROADCAST_PAGE_SIZE)
+        if not user_ids:
+            break
+        for telegram_id in user_ids:
+            await semaphore.acquire()
+            task = asyncio.create_task(send(telegram_id))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        after_id = user_ids[-1]
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    return sent, failed
@@ -0,0 +1,139 @@
+# stats.py
+import asyncio
+from config import STATS_FLUSH_INTERVAL, STATS_FLUSH_SIZE
+from database import db
+
+# Предельная пауза между повторами записи, пока база недоступна, секунд
+MAX_RETRY_DELAY = 60
+
+# Основа для буферов с отложенной записью: фоновая задача вызывает flush()
+# раз в interval секунд или сразу после wakeup(); при остановке буфер
+# сбрасывается в базу. После ошибки записи повтор откладывается с растущей
+# паузой (до MAX_RETRY_DELAY), и wakeup() на это время не действует.
+# Наследники реализуют flush().
+class BatchWriter:
+    name = "буфера"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.errors = 0
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def flush(self):
+        raise NotImplementedError
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        retry_delay = 0
+        while True:
+            if retry_delay:
+                await asyncio.sleep(retry_delay)
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                retry_delay = 0
+            except Exception as e:
+                self.errors += 1
+                retry_delay = min(max(retry_delay * 2, self.interval), MAX_RETRY_DELAY)
+                print(f"❌ Ошибка записи {self.name}, повтор через {retry_delay:.0f} с: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    # Останавливаем фоновую задачу и сбрасываем остаток буфера.
+    # Ошибку последней записи только логируем, чтобы не сорвать остальную остановку бота.
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ Ошибка записи {self.name} при остановке: {e}")
+
+
+# Отложенная запись статистики: приращения копятся в памяти по пользователю
+# (и теме) и сбрасываются в базу одним INSERT ... ON CONFLICT по таймеру или
+# при заполнении буфера. Вместо запроса на каждый ответ — один на интервал.
+class StatsBuffer(BatchWriter):
+    name = "статистики"
+
+    def __init__(self, database, interval=STATS_FLUSH_INTERVAL, max_pending=STATS_FLUSH_SIZE):
+        super().__init__(interval)
+        self.db = database
+        self.max_pending = max_pending
+        self.pending = {}  # (telegram_id, тема) -> [тестов, правильных ответов]
+        self.queued = 0
+        self.flushed = 0
+        self.flushes = 0
+
+    def add(self, telegram_id, tests=0, correct=0, topic=None):
+        self._merge((telegram_id, topic), tests, correct)
+        self.queued += 1
+        if len(self.pending) >= self.max_pending:
+            self.wakeup()
+
+    def _merge(self, key, tests, correct):
+        row = self.pending.get(key)
+        if row is None:
+            row = self.pending[key] = [0, 0]
+        row[0] += tests
+        row[1] += correct
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return []
+            batch = self.pending
+            self.pending = {}
+            users = {}
+            topic_rows = []
+            for (telegram_id, topic), row in batch.items():
+                total = users.get(telegram_id)
+                if total is None:
+                    total = users[telegram_id] = [0, 0]
+                total[0] += row[0]
+                total[1] += row[1]
+                if topic is not None:
+                    topic_rows.append((telegram_id, topic, row[0], row[1]))
+            try:
+                result = await self.db.add_user_stats_bulk(
+                    [(telegram_id, row[0], row[1]) for telegram_id, row in users.items()], topic_rows
+                )
+            except Exception:
+                # Возвращаем несохранённое обратно в буфер, чтобы не потерять;
+                # без wakeup() — повтор назначит _run после паузы
+                for key, row in batch.items():
+                    self._merge(key, row[0], row[1])
+                raise
+            self.flushed += len(batch)
+            self.flushes += 1
+            return result
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "pending_rows": len(self.pending),
+            "flushed_rows": self.flushed,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+
+# Глобальный буфер статистики
+stats_buffer = StatsBuffer(db)
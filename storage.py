@@ -0,0 +1,203 @@
+# storage.py
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import timedelta
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from config import FSM_TTL, FSM_CACHE_SIZE, FSM_CACHE_TTL
+from locks import KeyedLock
+
+# Как часто удалять из базы брошенные сессии (сек)
+CLEANUP_INTERVAL = 600
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+# Хранилище FSM в PostgreSQL поверх пула Database: сессии переживают перезапуск
+# и общие для всех процессов бота. Небольшой локальный кэш со сквозной записью
+# снимает повторные чтения, но другие процессы его не сбрасывают: он включается
+# (cache_size > 0) только при одном процессе или «липкой» маршрутизации по пользователю.
+# Запись старше ttl считается брошенной.
+class PostgresStorage(BaseStorage):
+    def __init__(
+        self,
+        database,
+        ttl: int = FSM_TTL,
+        cache_size: int = FSM_CACHE_SIZE,
+        cache_ttl: float = FSM_CACHE_TTL,
+        locking: bool = False,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.db = database
+        self.ttl = timedelta(seconds=ttl)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._cache = OrderedDict()  # key -> (истекает, state, data)
+        self._locks = KeyedLock() if locking else None
+        self._cleanup_task = None
+
+    def _lock(self, key):
+        return self._locks(key) if self._locks is not None else nullcontext()
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _cache_put(self, key, state, data):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.cache_ttl, state, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, key):
+        entry = self._cache_get(key)
+        if entry is not None:
+            return entry[1], entry[2]
+        async with self.db.pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT state, data FROM fsm_storage
+                WHERE key = $1 AND updated_at > now() - $2::interval
+            """, key, self.ttl)
+        if row is None:
+            state, data = None, {}
+        else:
+            state, data = row['state'], json.loads(row['data'])
+        self._cache_put(key, state, data)
+        return state, data
+
+    # Сброс состояния или данных. Пустую сессию не храним: если вторая половина
+    # тоже пуста (или сессия брошена), строка удаляется — проверка в SQL, без кэша.
+    # Если строки нет, делать нечего: отсутствие строки и есть пустая сессия.
+    async def _reset(self, key, column):
+        other = "data = '{}'::jsonb" if column == "state" else "state IS NULL"
+        empty = "NULL" if column == "state" else "'{}'::jsonb"
+        async with self.db.pool.acquire() as conn:
+            result = await conn.execute(f"""
+                DELETE FROM fsm_storage
+                WHERE key = $1 AND ({other} OR updated_at < now() - $2::interval)
+            """, key, self.ttl)
+            if result != "DELETE 0":
+                return True
+            await conn.execute(f"""
+                UPDATE fsm_storage SET {column} = {empty}, updated_at = now() WHERE key = $1
+            """, key)
+        return False
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self.key_builder.build(key)
+        state = state.state if isinstance(state, State) else state
+        async with self._lock(key):
+            cached = self._cache_get(key)
+            if state is None:
+                deleted = await self._reset(key, "state")
+                if cached is not None:
+                    self._cache_put(key, None, {} if deleted else cached[2])
+                return
+            async with self.db.pool.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO fsm_storage (key, state) VALUES ($1, $2)
+                    ON CONFLICT (key) DO UPDATE
+                    SET state = EXCLUDED.state,
+                        data = CASE WHEN fsm_storage.updated_at < now() - $3::interval
+                                    THEN '{}'::jsonb ELSE fsm_storage.data END,
+                        updated_at = now()
+                """, key, state, self.ttl)
+            if cached is not None:
+                self._cache_put(key, state, cached[2])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        key = self.key_builder.build(key)
+        data = dict(data)
+        async with self._lock(key):
+            cached = self._cache_get(key)
+            if not data:
+                deleted = await self._reset(key, "data")
+                if cached is not None:
+                    self._cache_put(key, None if deleted else cached[1], {})
+                return
+            async with self.db.pool.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO fsm_storage (key, data) VALUES ($1, $2::jsonb)
+                    ON CONFLICT (key) DO UPDATE
+                    SET data = EXCLUDED.data,
+                        state = CASE WHEN fsm_storage.updated_at < now() - $3::interval
+                                     THEN NULL ELSE fsm_storage.state END,
+                        updated_at = now()
+                """, key, _dumps(data), self.ttl)
+            if cached is not None:
+                self._cache_put(key, cached[1], data)
+
+    # Слияние выполняется в базе (jsonb ||), поэтому передаются только изменённые
+    # поля — например, курсор теста, а не весь список вопросов
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        key = self.key_builder.build(key)
+        async with self._lock(key):
+            cached = self._cache_get(key)
+            query = """
+                INSERT INTO fsm_storage (key, data) VALUES ($1, $2::jsonb)
+                ON CONFLICT (key) DO UPDATE
+                SET data = CASE WHEN fsm_storage.updated_at < now() - $3::interval
+                                THEN '{}'::jsonb ELSE fsm_storage.data END || EXCLUDED.data,
+                    updated_at = now()
+            """
+            async with self.db.pool.acquire() as conn:
+                if cached is not None:
+                    await conn.execute(query, key, _dumps(data), self.ttl)
+                    merged = dict(cached[2])
+                    merged.update(data)
+                    state = cached[1]
+                else:
+                    row = await conn.fetchrow(query + " RETURNING state, data", key, _dumps(data), self.ttl)
+                    merged = json.loads(row['data'])
+                    state = row['state']
+            self._cache_put(key, state, merged)
+            return dict(merged)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return dict(data)
+
+    # Удаление брошенных сессий
+    async def cleanup(self):
+        async with self.db.pool.acquire() as conn:
+            result = await conn.execute(
+                "DELETE FROM fsm_storage WHERE updated_at < now() - $1::interval", self.ttl
+            )
+        return int(result.split()[-1])
+
+    async def _run_cleanup(self):
+        while True:
+            await asyncio.sleep(CLEANUP_INTERVAL)
+            try:
+                await self.cleanup()
+            except Exception as e:
+                print(f"❌ Ошибка очистки сессий: {e}")
+
+    def start_cleanup(self):
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._run_cleanup())
+
+    async def close(self) -> None:
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+        self._cache.clear()
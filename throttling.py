@@ -0,0 +1,95 @@
+# throttling.py
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+from config import THROTTLE_RATE, THROTTLE_BURST, THROTTLE_DEDUP_WINDOW, THROTTLE_CACHE_SIZE
+from locks import KeyedLock
+from sender import TokenBucket
+
+# Блокировки по пользователю: обработчики и таймер теста меняют данные FSM
+# одного пользователя только по очереди
+user_locks = KeyedLock()
+
+
+# Внешний middleware (message, callback_query):
+# - повторное нажатие той же кнопки в том же сообщении в течение dedup_window отбрасывается;
+# - на пользователя действует ведро токенов, лишние обновления отбрасываются;
+# - обновления одного пользователя обрабатываются строго по очереди.
+# Ведра и отметки нажатий хранятся в LRU ограниченного размера.
+class UserThrottleMiddleware(BaseMiddleware):
+    def __init__(self, rate=THROTTLE_RATE, burst=THROTTLE_BURST, dedup_window=THROTTLE_DEDUP_WINDOW,
+                 cache_size=THROTTLE_CACHE_SIZE, locks=user_locks):
+        self.rate = rate
+        self.burst = burst
+        self.dedup_window = dedup_window
+        self.cache_size = cache_size
+        self.locks = locks
+        self.buckets = OrderedDict()  # telegram_id -> TokenBucket
+        self.recent = OrderedDict()  # (telegram_id, message_id, data) -> время нажатия
+        self.passed = 0
+        self.duplicates = 0
+        self.throttled = 0
+
+    def _bucket(self, telegram_id):
+        bucket = self.buckets.get(telegram_id)
+        if bucket is None:
+            bucket = self.buckets[telegram_id] = TokenBucket(self.rate, self.burst)
+            if len(self.buckets) > self.cache_size:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(telegram_id)
+        return bucket
+
+    def _is_duplicate(self, telegram_id, callback: CallbackQuery):
+        now = time.monotonic()
+        # Старые отметки лежат в начале: удаляем всё, что вышло из окна
+        while self.recent:
+            pressed = next(iter(self.recent.values()))
+            if now - pressed < self.dedup_window and len(self.recent) < self.cache_size:
+                break
+            self.recent.popitem(last=False)
+        message_id = callback.message.message_id if callback.message else None
+        key = (telegram_id, message_id, callback.data)
+        if key in self.recent:
+            return True
+        self.recent[key] = now
+        return False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery) and self._is_duplicate(user.id, event):
+            self.duplicates += 1
+            await event.answer()
+            return None
+        if not self._bucket(user.id).try_consume():
+            self.throttled += 1
+            if isinstance(event, CallbackQuery):
+                await event.answer("Слишком часто, подождите немного.")
+            return None
+
+        self.passed += 1
+        async with self.locks(user.id):
+            return await handler(event, data)
+
+    def stats(self):
+        return {
+            "passed": self.passed,
+            "duplicates": self.duplicates,
+            "throttled": self.throttled,
+            "tracked_users": len(self.buckets),
+            "active_locks": len(self.locks),
+        }
+
+
+# Глобальный middleware ограничения пользователей
+throttle = UserThrottleMiddleware()
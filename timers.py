@@ -0,0 +1,89 @@
+# timers.py
+import asyncio
+import heapq
+import itertools
+
+
+# Один планировщик на все сроки: куча (срок, номер, ключ, данные) и одна фоновая задача,
+# которая спит до ближайшего срока. На ключ действует только последний срок:
+# schedule() заменяет прежний, cancel() отменяет, а устаревшие записи кучи
+# пропускаются при извлечении и периодически вычищаются.
+class TimerWheel:
+    def __init__(self):
+        self._heap = []
+        self._active = {}  # ключ -> номер действующей записи
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._callback = None
+        self._running = set()
+        self.fired = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self._active)
+
+    def schedule(self, key, delay, payload=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        token = next(self._seq)
+        self._active[key] = token
+        heapq.heappush(self._heap, (deadline, token, key, payload))
+        # Новый срок раньше всех — будим фоновую задачу, чтобы она пересчитала сон
+        if self._heap[0][1] == token:
+            self._wakeup.set()
+        # Слишком много устаревших записей — пересобираем кучу
+        if len(self._heap) > 2 * len(self._active) + 1024:
+            self._heap = [entry for entry in self._heap if self._active.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+
+    def cancel(self, key):
+        self._active.pop(key, None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = self._heap[0][0] - loop.time() if self._heap else None
+            if timeout is None or timeout > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, token, key, payload = heapq.heappop(self._heap)
+                if self._active.get(key) != token:
+                    continue
+                del self._active[key]
+                self.fired += 1
+                task = asyncio.create_task(self._fire(key, payload))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    async def _fire(self, key, payload):
+        try:
+            await self._callback(key, payload)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ Ошибка обработки таймера {key}: {e}")
+
+    # callback(key, payload) вызывается при наступлении срока
+    def start(self, callback):
+        self._callback = callback
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self):
+        return {"active": len(self._active), "heap": len(self._heap), "fired": self.fired, "errors": self.errors}
+
+
+# Таймер тестов на время
+quiz_timer = TimerWheel()
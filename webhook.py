@@ -0,0 +1,95 @@
+# webhook.py
+import asyncio
+import signal
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    WEBHOOK_CONCURRENCY, SHUTDOWN_TIMEOUT,
+)
+
+
+# Обработчик вебхука aiogram: отвечает Telegram сразу, а обновление обрабатывает
+# в фоне, причём одновременно не больше max_concurrency обновлений.
+class LimitedRequestHandler(SimpleRequestHandler):
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.processed = 0
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+    async def _background_feed_update(self, bot, update):
+        self.in_flight += 1
+        self.drained.clear()
+        try:
+            async with self.semaphore:
+                await super()._background_feed_update(bot, update)
+        finally:
+            self.in_flight -= 1
+            self.processed += 1
+            if self.in_flight == 0:
+                self.drained.set()
+
+    # Ждём завершения уже принятых обновлений
+    async def drain(self, timeout):
+        try:
+            await asyncio.wait_for(self.drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"❌ Не дождались обработки {self.in_flight} обновлений")
+
+
+def create_app(dp: Dispatcher, bot: Bot, max_concurrency=WEBHOOK_CONCURRENCY):
+    app = web.Application()
+    handler = LimitedRequestHandler(dp, bot, max_concurrency, secret_token=WEBHOOK_SECRET)
+    handler.register(app, path=WEBHOOK_PATH)
+
+    async def health(request):
+        return web.json_response({
+            "status": "ok",
+            "in_flight": handler.in_flight,
+            "processed": handler.processed,
+        })
+
+    app.router.add_get("/health", health)
+    app["webhook_handler"] = handler
+    return app
+
+
+# Запуск в режиме вебхука; по SIGTERM/SIGINT перестаём принимать запросы
+# и дожидаемся обработки уже принятых обновлений
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    # Без секрета SimpleRequestHandler принимает любой POST, и кто угодно,
+    # у кого есть доступ к порту, может подсовывать обновления
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("Режим вебхука требует WEBHOOK_SECRET (заголовок X-Telegram-Bot-Api-Secret-Token)")
+    app = create_app(dp, bot)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    print(f"✅ Вебхук слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await stop.wait()
+    finally:
+        await site.stop()
+        await app["webhook_handler"].drain(SHUTDOWN_TIMEOUT)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await runner.cleanup()
+        await bot.session.close()